@@ -0,0 +1,70 @@
+"""
+Benchmark the outbox -> Firestore sync pipeline offline.
+
+Queues outbox rows and drains them through the in-memory Firestore gateway
+with simulated latency and errors, e.g.
+
+    python -m benchmarks.firestore_sync --rows 5000 --latency 0.05
+"""
+
+import argparse
+import time
+
+from benchmarks.harness import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument(
+        "--documents",
+        type=int,
+        default=500,
+        help="Distinct documents the rows are spread over.",
+    )
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from moderation.firestore import InMemoryFirestoreGateway
+    from moderation.models import FirestoreOutbox
+    from moderation.outbox import drain_outbox
+
+    with test_database():
+        FirestoreOutbox.objects.bulk_create(
+            [
+                FirestoreOutbox(
+                    document_path=f"Posts/p{i % args.documents}",
+                    data={"reviewed": True, "is_visible": i % 2 == 0},
+                )
+                for i in range(args.rows)
+            ],
+            batch_size=1000,
+        )
+        gateway = InMemoryFirestoreGateway(
+            latency=args.latency, error_rate=args.error_rate, seed=1
+        )
+
+        started = time.perf_counter()
+        while drain_outbox(gateway, args.batch_size):
+            pass
+        elapsed = time.perf_counter() - started
+
+        left = FirestoreOutbox.objects.count()
+
+    results = [
+        ("rows", args.rows),
+        ("elapsed", f"{elapsed:.3f}s"),
+        ("rows/second", f"{args.rows / elapsed:.0f}"),
+        ("round-trips", gateway.round_trips),
+        ("document writes", gateway.writes),
+        ("left to retry", left),
+    ]
+    for name, value in results:
+        print(f"{name + ':':<17}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark the per-row cost of flagged content list and export responses.
+
+Reads --rows rows of flagged content and turns them into a response the
+way the list endpoint used to and the way it does now:
+
+    serializer   model instances through FlaggedContentSerializer, then
+                 JSONRenderer
+    values       .values() rows through flagged_content_rows(), then
+                 FastJSONRenderer (orjson when it is installed)
+
+Each path is timed for fetching and serializing, for rendering, and for
+both together, and reported per row, e.g.
+
+    python -m benchmarks.serialization --rows 500
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+"""
+
+import argparse
+
+from benchmarks.harness import measure, setup_django, test_database
+
+
+def make_rows(count):
+    from moderation.models import FlaggedContent
+
+    FlaggedContent.objects.bulk_create(
+        [
+            FlaggedContent(
+                user=f"user{i % 100}",
+                post_id=f"post{i}",
+                comment_id=f"comment{i}" if i % 2 else None,
+                reason="Trigger words detected",
+                content="Benchmark content with ünïcödé " * 4,
+                reviewed=i % 3 == 0,
+            )
+            for i in range(count)
+        ],
+        batch_size=5000,
+    )
+
+
+def paths(queryset):
+    from rest_framework.renderers import JSONRenderer
+
+    from moderation.renderers import FastJSONRenderer
+    from moderation.serializers import (
+        FlaggedContentSerializer,
+        flagged_content_rows,
+        flagged_content_values,
+    )
+
+    def serializer():
+        return FlaggedContentSerializer(list(queryset), many=True).data
+
+    def values():
+        return list(flagged_content_rows(flagged_content_values(queryset)))
+
+    return {
+        "serializer": (serializer, JSONRenderer()),
+        "values": (values, FastJSONRenderer()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from moderation import renderers
+    from moderation.models import FlaggedContent
+
+    print(f"orjson: {'installed' if renderers.orjson else 'not installed'}")
+    print(f"{'path':<12}{'serialize':>14}{'render':>14}{'total':>14}")
+    with test_database():
+        make_rows(args.rows)
+        queryset = FlaggedContent.objects.order_by("flagged_at", "id")
+        for name, (serialize, renderer) in paths(queryset).items():
+            data = serialize()
+            timings = [
+                measure(serialize, args.repeat),
+                measure(lambda: renderer.render(data), args.repeat),
+                measure(lambda: renderer.render(serialize()), args.repeat),
+            ]
+            print(
+                f"{name:<12}"
+                + "".join(
+                    f"{timing['min'] / args.rows * 1e6:>11.2f} us"
+                    for timing in timings
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark import time and worker boot time.
+
+Each stage runs in a fresh interpreter so nothing is already imported:
+
+    settings     django.setup(), what every manage.py command pays
+    worker boot  import myapi.wsgi and load the URLconf and admin, what a
+                 gunicorn worker does before serving its first request
+
+Every stage is also run "eager", initializing firebase_admin and a
+Firestore client up front the way settings and views used to, to show
+what lazy initialization saves, e.g.
+
+    python -m benchmarks.startup --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.harness import BASE_DIR, measure
+
+STAGES = {
+    "settings": "import django; django.setup()",
+    "worker boot": (
+        "import myapi.wsgi;"
+        "from django.urls import get_resolver; get_resolver().url_patterns;"
+        "from django.contrib import admin; admin.autodiscover()"
+    ),
+}
+
+EAGER = (
+    "from moderation.firebase import get_app, get_firestore;"
+    "get_app(); get_firestore();"
+)
+
+PROBE = """
+import json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myapi.settings")
+started = time.perf_counter()
+{code}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "modules": len(sys.modules),
+    "firebase_admin": "firebase_admin" in sys.modules,
+    "grpc": "grpc" in sys.modules,
+}}))
+"""
+
+
+def run_probe(code):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code)],
+        cwd=BASE_DIR,
+        env=os.environ,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'stage':<24}{'median':>9}{'min':>9}{'process':>9}{'modules':>9}"
+        "  firebase_admin  grpc"
+    )
+    for stage, code in STAGES.items():
+        for label, probe in (
+            (stage, code),
+            (f"{stage} (eager)", code + ";" + EAGER),
+        ):
+            results = []
+            # Process time includes interpreter start-up; the probe's own
+            # timer covers only the stage itself
+            process = measure(
+                lambda: results.append(run_probe(probe)), args.repeat
+            )
+            seconds = [result["seconds"] for result in results]
+            print(
+                f"{label:<24}{statistics.median(seconds):>8.3f}s"
+                f"{min(seconds):>8.3f}s{process['median']:>8.3f}s"
+                f"{results[-1]['modules']:>9}"
+                f"  {str(results[-1]['firebase_admin']):<14}"
+                f"  {results[-1]['grpc']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
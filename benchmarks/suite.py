@@ -0,0 +1,334 @@
+"""
+Benchmark suite for the moderation API.
+
+Runs the hot endpoints through the full Django stack, with Firebase token
+verification stubbed the way the tests stub it, against a throwaway
+database:
+
+    check        POST /api/flagged-content/check/ for every combination of
+                 trigger-word count and content size
+    create       POST /api/flagged-content/ with the table at each size
+    list         GET /api/flagged-content/ (first page, and filtered)
+                 with the response cache off, and a cached page
+    auth         FirebaseAuthentication on a token-cache hit and miss
+
+Results are written as JSON and compared against a stored baseline. Any
+benchmark whose fastest run is more than --tolerance slower than its
+baseline fails the run; the minimum is compared because it is far less
+noisy than the median on a shared machine, e.g.
+
+    python -m benchmarks.suite --profile quick
+    python -m benchmarks.suite --profile full --output results.json
+    python -m benchmarks.suite --profile quick --save-baseline
+
+Baselines are machine-specific, so refresh benchmarks/baseline.json with
+--save-baseline on the machine that runs the comparison.
+"""
+
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from unittest.mock import patch
+
+from benchmarks.harness import measure, setup_django, test_database
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+MIN_SECONDS = 0.3
+MAX_REPEAT = 2000
+
+PROFILES = {
+    "quick": {
+        "words": [10, 1000],
+        "content": [100, 10 * 1024],
+        "rows": [1000, 10000],
+        "repeat": 5,
+    },
+    "full": {
+        "words": [10, 1000, 50000],
+        "content": [100, 10 * 1024, 1024 * 1024],
+        "rows": [10000, 1000000],
+        "repeat": 5,
+    },
+}
+
+
+def size_label(size):
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}MB"
+    if size >= 1024:
+        return f"{size // 1024}KB"
+    return f"{size}B"
+
+
+def make_words(count, rng):
+    # Distinct lowercase words, so the automaton grows with the count
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=8)))
+    return sorted(words)
+
+
+def make_content(size, words, rng):
+    # Prose-like text of `size` bytes with a trigger word roughly every
+    # 200 characters
+    parts = []
+    length = 0
+    while length < size:
+        if words and rng.random() < 0.05:
+            part = rng.choice(words)
+        else:
+            part = "".join(rng.choices(string.ascii_lowercase, k=5))
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)[:size]
+
+
+def load_trigger_words(words):
+    from moderation import versions
+    from moderation.matcher import invalidate_matcher
+    from moderation.models import TriggerWord
+
+    TriggerWord.objects.all().delete()
+    TriggerWord.objects.bulk_create(
+        [TriggerWord(word=word, category="benchmark") for word in words],
+        batch_size=5000,
+    )
+    versions.bump_version(versions.TRIGGER_WORDS)
+    invalidate_matcher()
+
+
+def grow_flagged_content(target):
+    # Add rows until the table holds `target`
+    from moderation.models import FlaggedContent
+
+    existing = FlaggedContent.objects.count()
+    batch = []
+    for i in range(existing, target):
+        row = FlaggedContent(
+            user=f"user{i % 1000}",
+            post_id=f"post{i}",
+            reason="Trigger words detected",
+            content="Benchmark content",
+            reviewed=i % 3 == 0,
+        )
+        row.dedup_key = FlaggedContent.make_dedup_key(
+            row.post_id, None, None, row.reason
+        )
+        batch.append(row)
+        if len(batch) == 5000:
+            FlaggedContent.objects.bulk_create(batch)
+            batch = []
+    FlaggedContent.objects.bulk_create(batch)
+
+
+def run_check(client, profile, rng, results):
+    from django.urls import reverse
+
+    url = reverse("flaggedcontent-check-content")
+    for count in profile["words"]:
+        words = make_words(count, rng)
+        load_trigger_words(words)
+        for size in profile["content"]:
+            content = make_content(size, words, rng)
+            # The first request builds the matcher
+            response = client.post(url, {"content": content}, format="json")
+            assert response.status_code == 200, response.content
+            run(
+                f"check/words={count}/content={size_label(size)}",
+                lambda: client.post(url, {"content": content}, format="json"),
+                profile["repeat"],
+                results,
+            )
+
+
+def run_rows(client, profile, results):
+    from django.test import override_settings
+    from django.urls import reverse
+
+    list_url = reverse("flaggedcontent-list")
+    for rows in profile["rows"]:
+        grow_flagged_content(rows)
+        counter = iter(range(sys.maxsize))
+
+        def create():
+            response = client.post(
+                list_url,
+                {
+                    "content": "Benchmark content",
+                    "user": "benchmark",
+                    "post_id": f"new{rows}-{next(counter)}",
+                    "reason": "Trigger words detected",
+                },
+                format="json",
+            )
+            assert response.status_code == 201, response.content
+
+        run(f"create/rows={rows}", create, profile["repeat"], results)
+        # The list cases measure the query and serialization, so the
+        # response cache is off for them and timed as a case of its own
+        with override_settings(MODERATION_RESPONSE_CACHE_TIMEOUT=0):
+            for name, params in (
+                (f"list/rows={rows}", {}),
+                (f"list/rows={rows}/unreviewed", {"reviewed": "false"}),
+            ):
+                run(
+                    name,
+                    partial(client.get, list_url, params),
+                    profile["repeat"],
+                    results,
+                )
+        run(
+            f"list/rows={rows}/cached",
+            lambda: client.get(list_url),
+            profile["repeat"],
+            results,
+        )
+
+
+def run_auth(profile, results):
+    from django.test import RequestFactory
+
+    from moderation.authentication import FirebaseAuthentication, token_cache
+
+    request = RequestFactory().get(
+        "/", HTTP_AUTHORIZATION="Bearer benchmark.token"
+    )
+    authentication = FirebaseAuthentication()
+
+    def miss():
+        token_cache.clear()
+        authentication.authenticate(request)
+
+    authentication.authenticate(request)
+    run(
+        "auth/token-cache-hit",
+        lambda: authentication.authenticate(request),
+        profile["repeat"],
+        results,
+    )
+    run("auth/token-cache-miss", miss, profile["repeat"], results)
+
+
+def run(name, func, repeat, results):
+    # Repeat fast benchmarks until they have run for about MIN_SECONDS, so
+    # sub-millisecond timings get enough samples to be stable
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    if elapsed > 0:
+        repeat = max(repeat, min(MAX_REPEAT, int(MIN_SECONDS / elapsed)))
+    results[name] = measure(func, repeat)
+    print_result(name, results[name])
+
+
+def print_result(name, result):
+    print(
+        f"{name:<40}{result['median'] * 1000:>10.2f} ms"
+        f"{result['min'] * 1000:>10.2f} ms"
+    )
+
+
+def compare(results, baseline, tolerance):
+    # Return the benchmarks whose fastest run regressed past the tolerance
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = result["min"] / reference["min"]
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--profile", choices=PROFILES, default="quick")
+    parser.add_argument("--repeat", type=int)
+    parser.add_argument(
+        "--only",
+        help="Comma-separated groups to run: check, rows (create and list)"
+        " and auth.",
+    )
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed slowdown; lower it on dedicated hardware.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the baseline for the profile.",
+    )
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.repeat:
+        profile["repeat"] = args.repeat
+    groups = set(args.only.split(",")) if args.only else None
+
+    setup_django()
+    from rest_framework.test import APIClient
+
+    results = {}
+    rng = random.Random(1)
+    with test_database(), patch(
+        "firebase_admin.auth.verify_id_token",
+        return_value={"uid": "benchmark"},
+    ):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer benchmark.token")
+        if groups is None or "check" in groups:
+            run_check(client, profile, rng, results)
+        if groups is None or "rows" in groups:
+            run_rows(client, profile, results)
+        if groups is None or "auth" in groups:
+            run_auth(profile, results)
+
+    report = {
+        "profile": args.profile,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    baselines = (
+        json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    )
+    if args.save_baseline:
+        baselines[args.profile] = report
+        baseline_path.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"Saved {args.profile} baseline to {baseline_path}")
+        return
+
+    baseline = baselines.get(args.profile)
+    if baseline is None:
+        print(f"No {args.profile} baseline in {baseline_path} to compare.")
+        return
+
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for name, ratio in regressions:
+        print(f"REGRESSION {name}: {ratio:.2f}x the baseline")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions against the {args.profile} baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark concurrent writes the way gunicorn workers make them.
+
+Starts --workers processes that all record flagged content reports at
+once, each followed by --reads queue reads, against:
+
+    sqlite           a fresh SQLite file with SQLite's default settings
+    sqlite (tuned)   the same with SQLITE_PRAGMAS (WAL, synchronous=NORMAL,
+                     busy_timeout, mmap_size)
+    database-url     the database at --database-url, e.g. Postgres
+
+The --database-url database is migrated and gets benchmark rows, which
+are deleted again afterwards, so point it at a scratch database, e.g.
+
+    python -m benchmarks.write_contention --workers 8 --writes 200
+    python -m benchmarks.write_contention \\
+        --database-url postgres://localhost/moderation_bench
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks.harness import setup_django
+
+BENCHMARK_USER = "write-contention"
+
+
+@contextmanager
+def environment(**values):
+    # Spawned processes read their settings from the environment
+    old = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def prepare(queue):
+    setup_django()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    queue.put(None)
+
+
+def clean_up(queue):
+    setup_django()
+    from moderation.models import FlaggedContent
+    from moderation.stats import delete_counted
+
+    delete_counted(FlaggedContent.objects.filter(user=BENCHMARK_USER))
+    queue.put(None)
+
+
+def worker(index, writes, reads, barrier, queue):
+    setup_django()
+    from django.db import OperationalError, connection
+
+    from moderation.flagging import build_flagged_content, record_report
+    from moderation.models import FlaggedContent
+
+    unreviewed = FlaggedContent.objects.filter(reviewed=False).order_by(
+        "flagged_at", "id"
+    )
+    latencies = []
+    errors = 0
+    barrier.wait()
+    for i in range(writes):
+        started = time.perf_counter()
+        try:
+            record_report(
+                build_flagged_content(
+                    {
+                        "content": "Benchmark content",
+                        "user": BENCHMARK_USER,
+                        "post_id": f"contention{index}-{i}",
+                        "reason": "Trigger words detected",
+                    }
+                )
+            )
+            for _ in range(reads):
+                list(unreviewed[:20])
+        except OperationalError:
+            # "database is locked" once busy_timeout runs out
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    queue.put((latencies, errors))
+
+
+def run_in_process(ctx, target):
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(queue,))
+    process.start()
+    queue.get()
+    process.join()
+
+
+def run_target(args):
+    ctx = multiprocessing.get_context("spawn")
+    run_in_process(ctx, prepare)
+
+    queue = ctx.Queue()
+    barrier = ctx.Barrier(args.workers + 1)
+    processes = [
+        ctx.Process(
+            target=worker,
+            args=(i, args.writes, args.reads, barrier, queue),
+        )
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    # Time from the moment every worker is ready to write
+    barrier.wait()
+    started = time.perf_counter()
+    results = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    run_in_process(ctx, clean_up)
+
+    latencies = sorted(
+        latency
+        for worker_latencies, _ in results
+        for latency in worker_latencies
+    )
+    errors = sum(worker_errors for _, worker_errors in results)
+    return {
+        "writes/s": (len(latencies) - errors) / elapsed,
+        "errors": errors,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def print_result(label, result):
+    print(
+        f"{label:<18}{result['writes/s']:>10.0f}{result['errors']:>8}"
+        f"{result['p50'] * 1000:>9.1f} ms{result['p99'] * 1000:>9.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--writes", type=int, default=200, help="Reports per worker."
+    )
+    parser.add_argument(
+        "--reads",
+        type=int,
+        default=1,
+        help="Queue reads after each report.",
+    )
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    print(f"{'target':<18}{'writes/s':>10}{'errors':>8}{'p50':>12}{'p99':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, tuning in (("sqlite", "False"), ("sqlite (tuned)", "True")):
+            path = Path(directory) / f"{tuning}.sqlite3"
+            with environment(
+                DATABASE_URL=f"sqlite:///{path}", SQLITE_TUNING=tuning
+            ):
+                print_result(label, run_target(args))
+
+    if args.database_url:
+        with environment(DATABASE_URL=args.database_url):
+            print_result("database-url", run_target(args))
+
+
+if __name__ == "__main__":
+    main()
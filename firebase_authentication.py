@@ -1,9 +1,7 @@
-import firebase_admin
-from firebase_admin import auth
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
-firebase_admin.initialize_app()
+from moderation.firebase import verify_id_token
 
 
 class FirebaseAuthentication(BaseAuthentication):
@@ -16,7 +14,7 @@ class FirebaseAuthentication(BaseAuthentication):
         try:
             # Extract token from header
             token = auth_header.split(" ")[1]
-            decoded_token = auth.verify_id_token(token)
+            decoded_token = verify_id_token(token)
             user_id = decoded_token["uid"]
 
             # Optionally, verify email and other fields
@@ -1,42 +1,29 @@
-import firebase_admin
-from firebase_admin import firestore
 from django.contrib import admin
-from .models import FlaggedContent, TriggerWord
+from .models import FirestoreOutbox, FlaggedContent, TriggerWord
 from django.contrib import messages
-
-# Initialize Firebase if it’s not already initialized
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
-
-# Reference to Firestore
-db = firestore.client()
+from django.db import transaction
+from .firestore import document_path
+from .outbox import enqueue_updates
+from .stats import delete_counted, update_counted
 
 
 @admin.action(description="Approve and make visible")
 def approve_flagged_content(modeladmin, request, queryset):
-    approved_posts = []
-    for flagged_content in queryset:
-        try:
-            # Update Firestore document's `is_visible` field
-            post_ref = db.collection("Posts").document(flagged_content.post_id)
-            post_ref.update({"is_visible": True})
-
-            # Update local Django database
-            flagged_content.is_visible = True
-            flagged_content.reviewed = True
-            flagged_content.save()
-            approved_posts.append(flagged_content.post_id)
-
-        except Exception as e:
-            messages.error(
-                request, f"Failed to approve {flagged_content.post_id}: {e}"
-            )
+    # Approve locally and queue the Firestore updates in the same
+    # transaction, like every other write, so the outbox applies them after
+    # any update already queued for the same documents
+    approval = {"is_visible": True, "reviewed": True}
+    with transaction.atomic():
+        rows = queryset.values_list("post_id", "comment_id", "reply_id")
+        paths = sorted({document_path(*row) for row in rows})
+        count = update_counted(queryset, **approval)
+        enqueue_updates([(path, approval) for path in paths])
 
     # Provide feedback to the admin
-    if approved_posts:
+    if count:
         messages.success(
             request,
-            f"{len(approved_posts)} post(s) approved and made visible.",
+            f"{count} item(s) approved and made visible.",
         )
 
 
@@ -45,17 +32,33 @@ class FlaggedContentAdmin(admin.ModelAdmin):
         "post_id",
         "reason",
         "user",
+        "report_count",
         "flagged_at",
         "reviewed",
         "is_visible",
     )
     actions = [approve_flagged_content]
-    readonly_fields = ["post_id", "content", "reason", "user", "flagged_at"]
+    readonly_fields = [
+        "post_id",
+        "content",
+        "reason",
+        "user",
+        "report_count",
+        "flagged_at",
+    ]
 
     def has_change_permission(self, request, obj=None):
         # Prevent editing of any fields other than the block/allow actions
         return False
 
+    # Deletes go through the stats counters as well
+    def delete_model(self, request, obj):
+        delete_counted(FlaggedContent.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_counted(queryset)
+
 
 admin.site.register(FlaggedContent, FlaggedContentAdmin)
 admin.site.register(TriggerWord)
+admin.site.register(FirestoreOutbox)
@@ -0,0 +1,181 @@
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .firestore import get_gateway
+from .flagging import (
+    build_flagged_content,
+    idempotency_cutoff,
+    record_report,
+    save_review,
+)
+from .matcher import aget_matcher
+from .metrics import timed
+from .models import FlagIdempotencyKey, FlaggedContent
+from .outbox import send_now
+from .serializers import FlaggedContentSerializer
+
+# Async versions of the hot FlaggedContentViewSet and TriggerWordViewSet
+# actions for ASGI deployments. DRF views are synchronous, so these are
+# plain Django views that reuse the project's DRF authenticators and
+# serializers, and return the same payloads as their viewset actions.
+
+
+def _authenticate(request):
+    drf_request = Request(
+        request,
+        authenticators=[
+            authenticator()
+            for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    )
+    return drf_request.user
+
+
+def async_api_view(methods):
+    # Method check, authentication and IsAuthenticated for an async view.
+    # Authenticators may hit the database, so they run in a thread.
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse(
+                    {"detail": f'Method "{request.method}" not allowed.'},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+
+            try:
+                user = await sync_to_async(_authenticate)(request)
+            except exceptions.APIException as e:
+                return JsonResponse(
+                    {"detail": str(e.detail)}, status=e.status_code
+                )
+            if not user.is_authenticated:
+                # Same status DRF picks when the first authenticator sends
+                # no WWW-Authenticate header
+                return JsonResponse(
+                    {"detail": exceptions.NotAuthenticated.default_detail},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+            request.user = user
+
+            try:
+                data = json.loads(request.body or b"{}")
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return JsonResponse(
+                    {"error": "Request body must be a JSON object."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            return await view(request, data, *args, **kwargs)
+
+        # Tokens travel in headers, and SessionAuthentication still
+        # enforces CSRF for cookie sessions
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+@async_api_view(["POST"])
+async def check_content(request, data):
+    content = data.get("content", "")
+    if not isinstance(content, str):
+        return JsonResponse(
+            {"error": "'content' must be a string."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    with timed("match"):
+        matcher = await aget_matcher()
+        result = matcher.scan(content)
+
+    if result["flagged"]:
+        result["message"] = "Content contains trigger words."
+
+    return JsonResponse(result, status=status.HTTP_200_OK)
+
+
+@async_api_view(["POST"])
+async def create_flagged_content(request, data):
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key and len(idempotency_key) > 255:
+        return JsonResponse(
+            {"error": "Idempotency-Key may be at most 255 characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        used = None
+        if idempotency_key:
+            # Retries are answered without leaving the event loop
+            used = (
+                await FlagIdempotencyKey.objects.select_related(
+                    "flagged_content"
+                )
+                .filter(
+                    key=idempotency_key, created_at__gte=idempotency_cutoff()
+                )
+                .afirst()
+            )
+
+        if used is not None:
+            flagged_content, created = used.flagged_content, False
+        else:
+            flagged_content, created = await sync_to_async(record_report)(
+                build_flagged_content(data), idempotency_key
+            )
+
+        return JsonResponse(
+            {
+                "success": True,
+                "id": flagged_content.id,
+                "report_count": flagged_content.report_count,
+                "duplicate": not created,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(["PUT", "PATCH"])
+async def update_flagged_content(request, data, pk):
+    try:
+        instance = await FlaggedContent.objects.aget(pk=pk)
+    except FlaggedContent.DoesNotExist:
+        return JsonResponse(
+            {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    serializer = FlaggedContentSerializer(
+        instance,
+        data={
+            field: data[field]
+            for field in ("reviewed", "is_visible")
+            if field in data
+        },
+        partial=True,
+    )
+    if not serializer.is_valid():
+        return JsonResponse(
+            serializer.errors, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # The change and its outbox row commit together as in the sync view,
+    # then the write is sent straight away with the async Firestore
+    # client. If that fails the sync_firestore worker retries it.
+    entry = await sync_to_async(save_review)(serializer)
+    await send_now(entry, get_gateway())
+
+    return JsonResponse(serializer.data, status=status.HTTP_200_OK)
@@ -1,11 +1,85 @@
-import firebase_admin
-from firebase_admin import auth
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import authentication, exceptions
 
+from .firebase import verify_id_token
+from .keystore import get_key_store
+from .metrics import timed
+
+
+class TokenCache:
+    # Bounded LRU of verified ID tokens, keyed by a hash of the token. An
+    # entry holds the decoded claims and the resolved user, and expires
+    # after FIREBASE_TOKEN_CACHE_TTL seconds or at the token's own `exp`,
+    # whichever comes first.
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token, claims, user):
+        max_size = getattr(settings, "FIREBASE_TOKEN_CACHE_SIZE", 10000)
+        ttl = getattr(settings, "FIREBASE_TOKEN_CACHE_TTL", 300)
+        expires_at = time.time() + ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, claims["exp"])
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+token_cache = TokenCache()
+
 
 class FirebaseAuthentication(authentication.BaseAuthentication):
 
     def authenticate(self, request):
+        with timed("auth"):
+            return self._authenticate(request)
+
+    def _authenticate(self, request):
         auth_header = request.headers.get("Authorization")
 
         if not auth_header:
@@ -13,13 +87,28 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
 
         token = auth_header.split(" ").pop()
 
+        # Repeat requests with a token we have already verified skip the
+        # signature check and the user lookup
+        cached = token_cache.get(token)
+        if cached is not None:
+            return (cached[1], None)
+
         try:
-            decoded_token = auth.verify_id_token(token)
+            with timed("verify"):
+                if getattr(settings, "FIREBASE_LOCAL_VERIFICATION", False):
+                    decoded_token = get_key_store().verify(token)
+                else:
+                    decoded_token = verify_id_token(token)
+        except ImproperlyConfigured:
+            # Missing or broken credentials are a server error, not a bad
+            # token
+            raise
         except Exception:
             raise exceptions.AuthenticationFailed("Invalid token")
 
         uid = decoded_token["uid"]
         user = self.get_or_create_user(uid)
+        token_cache.set(token, decoded_token, user)
 
         return (user, None)
 
@@ -0,0 +1,70 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from . import versions
+from .metrics import timed
+
+
+def conditional_response(request, name, build):
+    # Answer a GET from the `name` cache version, which every write to the
+    # table bumps. A client whose ETag is current gets a 304 before any
+    # query or serialization runs; otherwise the rendered JSON comes from
+    # the shared cache, or from build() and is then cached.
+    # Keys include the version, so a write makes the old entries
+    # unreachable and they expire on their own.
+    version, updated_at = versions.get_version_info(name)
+    if not version:
+        # Nothing has been written through the app yet
+        return build()
+
+    # The version is read before build() runs, so a page cached under it
+    # can only ever be newer than the version, never older
+    renderer = request.accepted_renderer.format
+    digest = hashlib.sha256(
+        f"{renderer} {request.get_full_path()}".encode()
+    ).hexdigest()[:16]
+    stamp = f"{name}.{version}.{int(updated_at.timestamp() * 1e6)}.{digest}"
+    etag = quote_etag(stamp)
+
+    # Only the ETag decides a 304. Last-Modified has one-second precision,
+    # so a write in the same second as a GET would look unmodified.
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return _add_validators(response, etag, updated_at)
+
+    # Only JSON is cached; the browsable API page differs per user
+    timeout = getattr(settings, "MODERATION_RESPONSE_CACHE_TIMEOUT", 300)
+    cacheable = timeout and renderer == "json"
+    key = f"moderation:response:{stamp}"
+    with timed("cache"):
+        cached = cache.get(key) if cacheable else None
+    if cached is not None:
+        content_type, content = cached
+        response = HttpResponse(content, content_type=content_type)
+    else:
+        response = build()
+        if cacheable and response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: cache.set(
+                    key, (rendered["Content-Type"], rendered.content), timeout
+                )
+            )
+    return _add_validators(response, etag, updated_at)
+
+
+def _add_validators(response, etag, updated_at):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(updated_at.timestamp())
+    # Authenticated data: clients may keep it but must revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Accept", "Authorization"])
+    return response
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(connection, **kwargs):
+    # Apply SQLITE_PRAGMAS to every new SQLite connection; other databases
+    # are left alone
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name == "journal_mode":
+                # The journal mode is stored in the database file, so only
+                # switch it once instead of rewriting the header on every
+                # connection
+                cursor.execute("PRAGMA journal_mode")
+                if str(cursor.fetchone()[0]).lower() == str(value).lower():
+                    continue
+            cursor.execute(f"PRAGMA {name} = {value}")
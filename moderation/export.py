@@ -0,0 +1,65 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .serializers import (
+    FlaggedContentSerializer,
+    flagged_content_rows,
+    flagged_content_values,
+)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class _Echo:
+    # File-like object for csv.writer that hands each line straight back
+    def write(self, value):
+        return value
+
+
+def _rows(queryset):
+    chunk_size = getattr(settings, "MODERATION_EXPORT_CHUNK_SIZE", 2000)
+    return flagged_content_rows(
+        flagged_content_values(queryset).iterator(chunk_size=chunk_size)
+    )
+
+
+def export_ndjson(queryset):
+    for row in _rows(queryset):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def export_csv(queryset):
+    fields = FlaggedContentSerializer.Meta.fields
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in _rows(queryset):
+        yield writer.writerow([row[field] for field in fields])
+
+
+async def _iterate_async(lines):
+    # Under ASGI, Django 4.2 reads a sync streaming iterator into a list
+    # before sending any of it. Hand the lines over a chunk at a time
+    # instead, reading each chunk in the thread that runs sync views so the
+    # queryset keeps its database connection.
+    chunk_size = getattr(settings, "MODERATION_EXPORT_CHUNK_SIZE", 2000)
+    read = sync_to_async(lambda: "".join(islice(lines, chunk_size)))
+    while chunk := await read():
+        yield chunk
+
+
+def export_flagged_content(queryset, export_format, asynchronous=False):
+    # Lazily render the queryset one row at a time, reading it from the
+    # database in chunks so memory use does not depend on the export size.
+    # Pass asynchronous=True when serving over ASGI.
+    if export_format == "csv":
+        lines = export_csv(queryset)
+    else:
+        lines = export_ndjson(queryset)
+    return _iterate_async(lines) if asynchronous else lines
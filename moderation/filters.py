@@ -0,0 +1,60 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+def _parse_boolean(name, value):
+    try:
+        return BOOLEAN_VALUES[value.lower()]
+    except KeyError:
+        raise ValidationError({name: "Must be true or false."})
+
+
+def _parse_datetime(name, value):
+    # The parsers return None for malformed values and raise ValueError
+    # for well-formed but impossible ones such as 2024-02-30
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is not None:
+                parsed = datetime.combine(date, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Must be an ISO 8601 date/time."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_flagged_content(queryset, params):
+    # Apply the list filters from the query string. Each one is backed by
+    # an index on FlaggedContent.
+    for name in ("reviewed", "is_visible"):
+        value = params.get(name)
+        if value:
+            queryset = queryset.filter(**{name: _parse_boolean(name, value)})
+
+    for name in ("reason", "user"):
+        value = params.get(name)
+        if value:
+            queryset = queryset.filter(**{name: value})
+
+    value = params.get("flagged_after")
+    if value:
+        queryset = queryset.filter(
+            flagged_at__gte=_parse_datetime("flagged_after", value)
+        )
+
+    value = params.get("flagged_before")
+    if value:
+        queryset = queryset.filter(
+            flagged_at__lt=_parse_datetime("flagged_before", value)
+        )
+
+    return queryset
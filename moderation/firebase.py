@@ -0,0 +1,102 @@
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# The Firebase Admin SDK pulls in google-auth, and Firestore adds grpc and
+# protobuf on top, so nothing here is imported until first use. Settings,
+# manage.py commands and worker boot never pay for it.
+
+_app = None
+_firestore = None
+_async_firestore = None
+_lock = threading.Lock()
+
+
+def credentials_info():
+    # FIREBASE_ADMIN_SDK holds the service account as JSON (Heroku) or the
+    # path to a JSON file (local development). Credentials are only read
+    # on first use, so a bad value is raised as ImproperlyConfigured rather
+    # than passing for a bad token.
+    value = settings.FIREBASE_ADMIN_SDK
+    if not value:
+        raise ImproperlyConfigured("FIREBASE_ADMIN_SDK is not set.")
+    try:
+        if value.startswith("{"):
+            return json.loads(value)
+        with open(value) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise ImproperlyConfigured(
+            f"FIREBASE_ADMIN_SDK is not a service account JSON or the path "
+            f"to one: {e}"
+        ) from e
+
+
+def project_id():
+    if settings.FIREBASE_PROJECT_ID:
+        return settings.FIREBASE_PROJECT_ID
+    try:
+        return credentials_info()["project_id"]
+    except (KeyError, TypeError) as e:
+        raise ImproperlyConfigured(
+            "Set FIREBASE_PROJECT_ID, or use FIREBASE_ADMIN_SDK credentials "
+            "with a project_id."
+        ) from e
+
+
+def get_app():
+    # The default Firebase app, initialized once on first use
+    global _app
+
+    if _app is None:
+        with _lock:
+            if _app is None:
+                import firebase_admin
+                from firebase_admin import credentials
+
+                try:
+                    _app = firebase_admin.get_app()
+                except ValueError:
+                    info = credentials_info()
+                    try:
+                        certificate = credentials.Certificate(info)
+                    except ValueError as e:
+                        raise ImproperlyConfigured(
+                            f"Invalid FIREBASE_ADMIN_SDK credentials: {e}"
+                        ) from e
+                    _app = firebase_admin.initialize_app(certificate)
+    return _app
+
+
+def get_firestore():
+    global _firestore
+
+    if _firestore is None:
+        app = get_app()
+        with _lock:
+            if _firestore is None:
+                from firebase_admin import firestore
+
+                _firestore = firestore.client(app)
+    return _firestore
+
+
+def get_async_firestore():
+    global _async_firestore
+
+    if _async_firestore is None:
+        app = get_app()
+        with _lock:
+            if _async_firestore is None:
+                from firebase_admin import firestore_async
+
+                _async_firestore = firestore_async.client(app)
+    return _async_firestore
+
+
+def verify_id_token(token):
+    from firebase_admin import auth
+
+    return auth.verify_id_token(token, app=get_app())
@@ -0,0 +1,183 @@
+import asyncio
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import firebase
+from .metrics import timed
+
+# Firestore accepts at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+
+def document_path(post_id, comment_id=None, reply_id=None):
+    # Path of the Firestore document a flag refers to
+    if reply_id:
+        return f"Posts/{post_id}/Comments/{comment_id}/Replies/{reply_id}"
+    if comment_id:
+        return f"Posts/{post_id}/Comments/{comment_id}"
+    return f"Posts/{post_id}"
+
+
+class FirestoreGateway:
+    # Everything the app writes to Firestore goes through a gateway.
+    # Backends implement update() and commit_batch(); batching and
+    # per-document fallback live here so every backend behaves the same.
+
+    def document_path(self, post_id, comment_id=None, reply_id=None):
+        return document_path(post_id, comment_id, reply_id)
+
+    def update(self, path, data):
+        raise NotImplementedError
+
+    def commit_batch(self, updates):
+        # Apply (path, data) updates atomically in one round-trip
+        raise NotImplementedError
+
+    def batch_update(self, updates):
+        # Apply (path, data) updates in as few batch commits as possible and
+        # return {path: error} for the ones that failed. A batch is atomic,
+        # so when one fails its documents are retried one by one to keep a
+        # single missing document from failing the rest.
+        failed = {}
+        with timed("firestore"):
+            for i in range(0, len(updates), MAX_BATCH_WRITES):
+                chunk = updates[i : i + MAX_BATCH_WRITES]
+                try:
+                    self.commit_batch(chunk)
+                except Exception:
+                    for path, data in chunk:
+                        try:
+                            self.update(path, data)
+                        except Exception as e:
+                            failed[path] = e
+        return failed
+
+    async def update_async(self, path, data):
+        await sync_to_async(self.update, thread_sensitive=False)(path, data)
+
+    async def batch_update_async(self, updates):
+        return await sync_to_async(self.batch_update, thread_sensitive=False)(
+            updates
+        )
+
+
+class FirebaseFirestoreGateway(FirestoreGateway):
+    # Real Firestore through the Firebase Admin SDK
+
+    def __init__(self, client=None):
+        self._client = client
+        self._async_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = firebase.get_firestore()
+        return self._client
+
+    def update(self, path, data):
+        self.client.document(path).update(data)
+
+    def commit_batch(self, updates):
+        batch = self.client.batch()
+        for path, data in updates:
+            batch.update(self.client.document(path), data)
+        batch.commit()
+
+    async def update_async(self, path, data):
+        if self._async_client is None:
+            self._async_client = firebase.get_async_firestore()
+        await self._async_client.document(path).update(data)
+
+
+class FirestoreUnavailable(Exception):
+    pass
+
+
+class InMemoryFirestoreGateway(FirestoreGateway):
+    # Local stand-in for load tests and offline benchmarks. Every call
+    # sleeps for `latency` seconds, like a network round-trip, and fails
+    # with probability `error_rate`. With `strict`, updating a document
+    # that does not exist fails the way it does in Firestore.
+
+    def __init__(self, latency=0.0, error_rate=0.0, strict=False, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.strict = strict
+        self.documents = {}
+        self.round_trips = 0
+        self.writes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fails(self):
+        with self._lock:
+            self.round_trips += 1
+            return self._random.random() < self.error_rate
+
+    def _apply(self, updates):
+        with self._lock:
+            if self.strict:
+                for path, _ in updates:
+                    if path not in self.documents:
+                        raise KeyError(f"No document to update: {path}")
+            for path, data in updates:
+                self.documents.setdefault(path, {}).update(data)
+                self.writes += 1
+
+    def update(self, path, data):
+        time.sleep(self.latency)
+        if self._fails():
+            raise FirestoreUnavailable("Injected Firestore error")
+        self._apply([(path, data)])
+
+    def commit_batch(self, updates):
+        time.sleep(self.latency)
+        if self._fails():
+            raise FirestoreUnavailable("Injected Firestore error")
+        self._apply(updates)
+
+    async def update_async(self, path, data):
+        await asyncio.sleep(self.latency)
+        if self._fails():
+            raise FirestoreUnavailable("Injected Firestore error")
+        self._apply([(path, data)])
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    # Build the backend named by MODERATION_FIRESTORE_GATEWAY once per
+    # process, with MODERATION_FIRESTORE_GATEWAY_OPTIONS as its arguments
+    global _gateway
+
+    with _gateway_lock:
+        if _gateway is None:
+            gateway_class = import_string(
+                getattr(
+                    settings,
+                    "MODERATION_FIRESTORE_GATEWAY",
+                    "moderation.firestore.FirebaseFirestoreGateway",
+                )
+            )
+            options = getattr(
+                settings, "MODERATION_FIRESTORE_GATEWAY_OPTIONS", {}
+            )
+            _gateway = gateway_class(**options)
+        return _gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    global _gateway
+
+    if setting.startswith("MODERATION_FIRESTORE_GATEWAY"):
+        _gateway = None
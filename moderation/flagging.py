@@ -0,0 +1,235 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import versions
+from .firestore import document_path
+from .models import FlagIdempotencyKey, FlaggedContent
+from .outbox import enqueue_update, enqueue_updates
+from .stats import (
+    apply_deltas,
+    count_rows,
+    row_values,
+    update_counted,
+)
+
+
+def build_flagged_content(data):
+    # Get parent type and set required fields
+    parent_type = data.get("parent_type", "post")
+    required_fields = ["content", "reason", "user"]
+
+    # Ensure required fields based on parent_type
+    if parent_type == "post":
+        required_fields.append("post_id")
+    elif parent_type == "comment":
+        required_fields.extend(["post_id", "comment_id"])
+    elif parent_type == "reply":
+        required_fields.extend(["post_id", "comment_id", "reply_id"])
+    else:
+        raise ValueError("Invalid parent_type specified.")
+
+    # Check for missing fields
+    for field in required_fields:
+        if field not in data:
+            raise ValueError(
+                f"'{field}' is a required field for {parent_type}."
+            )
+
+    flagged_content = FlaggedContent(
+        post_id=data.get("post_id"),
+        content=data["content"],
+        reason=data["reason"],
+        user=data["user"],
+        comment_id=data.get("comment_id"),
+        reply_id=data.get("reply_id"),
+    )
+    flagged_content.dedup_key = FlaggedContent.make_dedup_key(
+        flagged_content.post_id,
+        flagged_content.comment_id,
+        flagged_content.reply_id,
+        flagged_content.reason,
+    )
+    return flagged_content
+
+
+def record_report(flagged_content, idempotency_key=None):
+    # Save a new report, or count it against the existing row for the same
+    # content and reason. Returns (row, created). A request repeating an
+    # idempotency key gets the original row back and changes nothing.
+    try:
+        with transaction.atomic():
+            if idempotency_key:
+                used = (
+                    FlagIdempotencyKey.objects.select_related(
+                        "flagged_content"
+                    )
+                    .filter(key=idempotency_key)
+                    .first()
+                )
+                if used is not None:
+                    if used.created_at >= idempotency_cutoff():
+                        return used.flagged_content, False
+                    # Expired, so the key counts as a new request
+                    used.delete()
+
+            created = _increment_or_insert(flagged_content)
+            if created:
+                apply_deltas(count_rows([row_values(flagged_content)]))
+            else:
+                _reopen([flagged_content.dedup_key])
+                flagged_content = FlaggedContent.objects.get(
+                    dedup_key=flagged_content.dedup_key
+                )
+            versions.bump_version(versions.FLAGGED_CONTENT)
+
+            if idempotency_key:
+                FlagIdempotencyKey.objects.create(
+                    key=idempotency_key, flagged_content=flagged_content
+                )
+            return flagged_content, created
+
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        # A concurrent request with the same key won the race
+        used = FlagIdempotencyKey.objects.select_related(
+            "flagged_content"
+        ).get(key=idempotency_key)
+        return used.flagged_content, False
+
+
+def _increment_or_insert(flagged_content):
+    key = flagged_content.dedup_key
+    if _increment(key, 1):
+        return False
+
+    try:
+        with transaction.atomic():
+            flagged_content.save()
+        return True
+    except IntegrityError:
+        # Another worker inserted the same report first
+        if _increment(key, 1):
+            return False
+        raise
+
+
+def _increment(key, count):
+    return FlaggedContent.objects.filter(dedup_key=key).update(
+        report_count=F("report_count") + count
+    )
+
+
+def _reopen(keys):
+    # Put reviewed content that is reported again back in the moderation
+    # queue, with the counters adjusted and Firestore told
+    reviewed = FlaggedContent.objects.filter(dedup_key__in=keys, reviewed=True)
+    paths = {
+        document_path(*row)
+        for row in reviewed.values_list("post_id", "comment_id", "reply_id")
+    }
+    if paths:
+        update_counted(reviewed, reviewed=False)
+        enqueue_updates([(path, {"reviewed": False}) for path in paths])
+
+
+def idempotency_cutoff():
+    # Idempotency keys older than this have expired
+    ttl = getattr(settings, "MODERATION_IDEMPOTENCY_KEY_TTL", 86400)
+    return timezone.now() - timedelta(seconds=ttl)
+
+
+def prune_idempotency_keys():
+    # Delete expired idempotency keys and return how many there were
+    return FlagIdempotencyKey.objects.filter(
+        created_at__lt=idempotency_cutoff()
+    ).delete()[0]
+
+
+def record_reports(flagged_contents):
+    # Bulk form of record_report. Reports are collapsed by dedup key, rows
+    # that already exist have their counts bumped and the rest are inserted
+    # with one bulk_create. Returns (created, duplicates).
+    reports = {}
+    for flagged_content in flagged_contents:
+        key = flagged_content.dedup_key
+        if key in reports:
+            reports[key].report_count += 1
+        else:
+            reports[key] = flagged_content
+
+    try:
+        created = _apply_reports(reports)
+    except IntegrityError:
+        # Another worker inserted one of these reports first, so the
+        # existing rows are read again
+        created = _apply_reports(reports)
+
+    return created, len(flagged_contents) - created
+
+
+def _apply_reports(reports):
+    with transaction.atomic():
+        existing = set()
+        keys = list(reports)
+        for i in range(0, len(keys), 500):
+            existing.update(
+                FlaggedContent.objects.filter(
+                    dedup_key__in=keys[i : i + 500]
+                ).values_list("dedup_key", flat=True)
+            )
+
+        # One UPDATE per distinct increment, usually just one
+        increments = {}
+        for key in existing:
+            count = reports[key].report_count
+            increments.setdefault(count, []).append(key)
+        for count, keys in increments.items():
+            for i in range(0, len(keys), 500):
+                FlaggedContent.objects.filter(
+                    dedup_key__in=keys[i : i + 500]
+                ).update(report_count=F("report_count") + count)
+        repeated = list(existing)
+        for i in range(0, len(repeated), 500):
+            _reopen(repeated[i : i + 500])
+
+        new = [
+            flagged_content
+            for key, flagged_content in reports.items()
+            if key not in existing
+        ]
+        FlaggedContent.objects.bulk_create(new, batch_size=500)
+        apply_deltas(count_rows(row_values(row) for row in new))
+        if reports:
+            versions.bump_version(versions.FLAGGED_CONTENT)
+
+    return len(new)
+
+
+def save_review(serializer):
+    # Save a reviewed/is_visible change, adjust the stats counters, bump the
+    # flagged content version and queue the Firestore update in one
+    # transaction, so the update is queued if and only if the change
+    # commits. Returns the outbox row.
+    with transaction.atomic():
+        # Apply the change to the row read again under the lock, so report
+        # counts and reopens committed since the view fetched it are kept
+        instance = FlaggedContent.objects.select_for_update().get(
+            pk=serializer.instance.pk
+        )
+        before = row_values(instance)
+        serializer.instance = instance
+        serializer.save()
+        deltas = count_rows([before], -1)
+        apply_deltas(count_rows([row_values(instance)], 1, deltas))
+        versions.bump_version(versions.FLAGGED_CONTENT)
+        return enqueue_update(
+            document_path(
+                instance.post_id, instance.comment_id, instance.reply_id
+            ),
+            {"is_visible": instance.is_visible, "reviewed": instance.reviewed},
+        )
@@ -0,0 +1,180 @@
+import json
+import logging
+import re
+import threading
+import time
+
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import firebase
+
+logger = logging.getLogger(__name__)
+
+# Certificates Google signs Firebase ID tokens with
+GOOGLE_PUBLIC_KEYS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+
+# Keys are reloaded at most once in this many seconds, however short the
+# advertised lifetime and however many unknown key ids arrive
+MIN_RELOAD_INTERVAL = 30
+
+_max_age = re.compile(r"max-age=(\d+)")
+
+
+class PublicKeyStore:
+    # In-memory copy of the certificates ID tokens are signed with. Keys are
+    # loaded from `source`, either an http(s) URL serving {kid: PEM} JSON or
+    # a path to a file holding the same, and refreshed by a background
+    # thread before they go stale. Requests only ever read the parsed keys,
+    # so verifying a token never waits on a fetch.
+
+    def __init__(self, source, project_id, refresh_interval=3600):
+        self.source = source
+        self.project_id = project_id
+        self.refresh_interval = refresh_interval
+        self._keys = {}
+        self._refresh_at = 0.0
+        self._attempted_at = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        # Return the raw {kid: PEM} mapping and how long it stays fresh
+        if self.source.startswith(("http://", "https://")):
+            response = requests.get(self.source, timeout=10)
+            response.raise_for_status()
+            max_age = _max_age.search(
+                response.headers.get("Cache-Control", "")
+            )
+            lifetime = int(max_age.group(1)) if max_age else None
+            return response.json(), lifetime
+        with open(self.source) as f:
+            return json.load(f), None
+
+    def load(self):
+        # Fetch and parse the keys, then swap them in all at once
+        self._attempted_at = time.monotonic()
+        certificates, lifetime = self._fetch()
+        keys = {
+            kid: load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certificates.items()
+        }
+        if lifetime is None:
+            lifetime = self.refresh_interval
+        self._keys = keys
+        # Refresh at half the advertised lifetime so new keys are in place
+        # well before the old ones expire, but never in a tight loop when
+        # the lifetime is max-age=0
+        self._refresh_at = time.monotonic() + max(
+            lifetime / 2, MIN_RELOAD_INTERVAL
+        )
+        return len(keys)
+
+    def start(self):
+        # Start the refresh thread once; returns straight away
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="firebase-keys", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            delay = self._refresh_at - time.monotonic()
+            if delay > 0 and self._wake.wait(delay):
+                self._wake.clear()
+            try:
+                self.load()
+            except Exception:
+                logger.exception("Could not refresh Firebase public keys")
+                # Keep the keys we have and try again shortly
+                self._refresh_at = time.monotonic() + max(
+                    min(60, self.refresh_interval), MIN_RELOAD_INTERVAL
+                )
+
+    def refresh_soon(self):
+        # Ask the refresh thread to reload now, without waiting for it
+        attempted_at = self._attempted_at
+        if (
+            attempted_at is None
+            or time.monotonic() - attempted_at >= MIN_RELOAD_INTERVAL
+        ):
+            self._wake.set()
+        self.start()
+
+    def verify(self, token):
+        # Verify a Firebase ID token against the keys in memory and return
+        # its claims, with `uid` set the way firebase_admin sets it
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._keys.get(kid)
+        if key is None:
+            # Unknown key, most likely a rotation we have not picked up yet
+            self.refresh_soon()
+            raise jwt.InvalidKeyError(f"No public key for kid {kid!r}")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=self.project_id,
+            issuer=f"https://securetoken.google.com/{self.project_id}",
+            options={"require": ["exp", "iat", "sub"]},
+        )
+        if not isinstance(claims["sub"], str) or not claims["sub"]:
+            raise jwt.InvalidTokenError("Token has no subject")
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_key_store():
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = PublicKeyStore(
+                getattr(
+                    settings,
+                    "FIREBASE_PUBLIC_KEYS_SOURCE",
+                    GOOGLE_PUBLIC_KEYS_URL,
+                ),
+                firebase.project_id(),
+                getattr(settings, "FIREBASE_PUBLIC_KEYS_REFRESH", 3600),
+            )
+        return _store
+
+
+@receiver(setting_changed)
+def reset_key_store(setting, **kwargs):
+    global _store
+
+    if setting.startswith("FIREBASE_PUBLIC_KEYS") or (
+        setting == "FIREBASE_PROJECT_ID"
+    ):
+        _store = None
+
+
+def warm_up():
+    # Called once per worker at boot: load the keys before the first
+    # request and leave the refresh thread running
+    if not getattr(settings, "FIREBASE_LOCAL_VERIFICATION", False):
+        return
+
+    store = get_key_store()
+    try:
+        store.load()
+    except Exception:
+        logger.exception("Could not load Firebase public keys at startup")
+    store.start()
@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+from collections import namedtuple
+
+from django.utils import timezone
+
+from .models import TriggerWord
+from .signals import trigger_word_batch
+
+# Formats trigger words are imported from and exported to
+LEXICON_FORMATS = {
+    "json": "application/json",
+    "csv": "text/csv",
+}
+LEXICON_FIELDS = ["word", "category", "whole_word"]
+
+_TRUE = {"true", "1", "yes", "y", "t"}
+_FALSE = {"false", "0", "no", "n", "f"}
+
+# What an import would change: rows to create and update, words to
+# delete, and how many entries already match the table
+Diff = namedtuple("Diff", ["create", "update", "delete", "unchanged"])
+
+
+def parse_lexicon(text, lexicon_format):
+    # Read entries from CSV with a header row, or from a JSON list of
+    # objects (optionally wrapped as {"words": [...]})
+    if lexicon_format == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("words")
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of trigger words.")
+    return data
+
+
+def _clean_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in _TRUE:
+        return True
+    if isinstance(value, str) and value.strip().lower() in _FALSE:
+        return False
+    raise ValueError("'whole_word' must be true or false.")
+
+
+def clean_entries(items):
+    # Validate raw entries and return ({word: (category, whole_word)},
+    # errors). whole_word is None when an entry leaves it out, so an
+    # update keeps the current value. A word listed twice takes its last
+    # entry.
+    max_word = TriggerWord._meta.get_field("word").max_length
+    max_category = TriggerWord._meta.get_field("category").max_length
+
+    entries = {}
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each trigger word must be an object.")
+            word = item.get("word")
+            category = item.get("category")
+            if not isinstance(word, str) or not word.strip():
+                raise ValueError("'word' is required.")
+            if not isinstance(category, str) or not category.strip():
+                raise ValueError("'category' is required.")
+            word = word.strip()
+            category = category.strip()
+            if len(word) > max_word:
+                raise ValueError(
+                    f"'word' may be at most {max_word} characters."
+                )
+            if len(category) > max_category:
+                raise ValueError(
+                    f"'category' may be at most {max_category} characters."
+                )
+            whole_word = item.get("whole_word")
+            if whole_word in (None, ""):
+                whole_word = None
+            else:
+                whole_word = _clean_bool(whole_word)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        entries[word] = (category, whole_word)
+    return entries, errors
+
+
+def diff_lexicon(entries, replace=False):
+    # Compare entries with the table. With replace, words missing from
+    # entries are deleted so the table ends up matching them exactly.
+    if replace:
+        existing = {row.word: row for row in TriggerWord.objects.all()}
+    else:
+        existing = {}
+        words = list(entries)
+        for i in range(0, len(words), 500):
+            existing.update(
+                (row.word, row)
+                for row in TriggerWord.objects.filter(
+                    word__in=words[i : i + 500]
+                )
+            )
+
+    create = []
+    update = []
+    unchanged = 0
+    for word, (category, whole_word) in entries.items():
+        row = existing.get(word)
+        if row is None:
+            create.append(
+                TriggerWord(
+                    word=word,
+                    category=category,
+                    whole_word=True if whole_word is None else whole_word,
+                )
+            )
+            continue
+        if whole_word is None:
+            whole_word = row.whole_word
+        if row.category == category and row.whole_word == whole_word:
+            unchanged += 1
+            continue
+        row.category = category
+        row.whole_word = whole_word
+        update.append(row)
+
+    delete = []
+    if replace:
+        delete = [word for word in existing if word not in entries]
+    return Diff(create, update, delete, unchanged)
+
+
+def apply_diff(diff):
+    # Write a diff in one transaction, bumping the trigger word version
+    # once however many rows change
+    with trigger_word_batch() as batch:
+        if diff.create:
+            TriggerWord.objects.bulk_create(diff.create, batch_size=500)
+        if diff.update:
+            # bulk_update does not apply auto_now
+            now = timezone.now()
+            for row in diff.update:
+                row.updated_at = now
+            TriggerWord.objects.bulk_update(
+                diff.update,
+                ["category", "whole_word", "updated_at"],
+                batch_size=500,
+            )
+        if diff.delete:
+            delete_words(diff.delete)
+        if diff.create or diff.update:
+            batch["changed"] = True
+    return summarize(diff)
+
+
+def delete_words(words):
+    # Delete the named words with a single version bump and return how
+    # many existed
+    deleted = 0
+    with trigger_word_batch():
+        for i in range(0, len(words), 500):
+            deleted += TriggerWord.objects.filter(
+                word__in=words[i : i + 500]
+            ).delete()[0]
+    return deleted
+
+
+def summarize(diff):
+    return {
+        "created": len(diff.create),
+        "updated": len(diff.update),
+        "deleted": len(diff.delete),
+        "unchanged": diff.unchanged,
+    }
+
+
+def export_lexicon(lexicon_format):
+    # Every trigger word, in a form import accepts unchanged
+    rows = TriggerWord.objects.order_by("word").values_list(*LEXICON_FIELDS)
+    if lexicon_format == "csv":
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(LEXICON_FIELDS)
+        for word, category, whole_word in rows:
+            writer.writerow([word, category, str(whole_word).lower()])
+        return output.getvalue()
+    return json.dumps(
+        [dict(zip(LEXICON_FIELDS, row)) for row in rows], ensure_ascii=False
+    )
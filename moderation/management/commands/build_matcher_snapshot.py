@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from moderation import versions
+from moderation.matcher import build_matcher
+from moderation.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the trigger words into the matcher snapshot that workers "
+        "memory-map."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=settings.MODERATION_MATCHER_SNAPSHOT_PATH,
+            help="Defaults to MODERATION_MATCHER_SNAPSHOT_PATH.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path:
+            raise CommandError(
+                "Set MODERATION_MATCHER_SNAPSHOT_PATH or pass --path."
+            )
+
+        with transaction.atomic():
+            version = versions.get_version(versions.TRIGGER_WORDS)
+            matcher = build_matcher()
+        if not write_snapshot(path, matcher, version):
+            self.stdout.write(f"{path} already holds a newer snapshot.")
+            return
+        self.stdout.write(
+            f"Wrote {len(matcher)} trigger word(s) at version {version} "
+            f"to {path}."
+        )
@@ -0,0 +1,73 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from moderation.lexicon import (
+    LEXICON_FORMATS,
+    apply_diff,
+    clean_entries,
+    diff_lexicon,
+    parse_lexicon,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update trigger words from a CSV or JSON file, writing "
+        "only what changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=LEXICON_FORMATS,
+            help="File format; taken from the extension by default.",
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Also delete trigger words that are not in the file.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without writing anything.",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        lexicon_format = options["format"] or path.suffix.lstrip(".").lower()
+        if lexicon_format not in LEXICON_FORMATS:
+            raise CommandError("Pass --format json or --format csv.")
+
+        try:
+            items = parse_lexicon(
+                path.read_text(encoding="utf-8-sig"), lexicon_format
+            )
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        entries, errors = clean_entries(items)
+        if errors:
+            for error in errors:
+                self.stderr.write(f"Entry {error['index']}: {error['error']}")
+            raise CommandError(f"{len(errors)} invalid entries, nothing done.")
+
+        with transaction.atomic():
+            diff = diff_lexicon(entries, options["replace"])
+            if options["dry_run"]:
+                result = summarize(diff)
+            else:
+                result = apply_diff(diff)
+
+        self.stdout.write(
+            "{prefix}{created} created, {updated} updated, {deleted} "
+            "deleted, {unchanged} unchanged.".format(
+                prefix="Dry run: " if options["dry_run"] else "",
+                **result,
+            )
+        )
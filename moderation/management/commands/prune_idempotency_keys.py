@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from moderation.flagging import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete Idempotency-Key records older than "
+        "MODERATION_IDEMPOTENCY_KEY_TTL, e.g. from a daily scheduler."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {prune_idempotency_keys()} key(s).")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from moderation.stats import recount
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the flagged content stats counters from the table, e.g. "
+        "after rows were changed outside the app."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rebuilt {recount()} counter(s).")
@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from moderation.firestore import get_gateway
+from moderation.outbox import drain_outbox, retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Send queued visibility updates from the outbox to Firestore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the updates that are due now, then exit.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MODERATION_OUTBOX_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        gateway = get_gateway()
+        interval = settings.MODERATION_OUTBOX_POLL_INTERVAL
+
+        errors = 0
+        while True:
+            try:
+                sent = drain_outbox(gateway, options["batch_size"])
+            except Exception as e:
+                # e.g. "database is locked"; the leased rows are picked up
+                # again once their lease runs out. A one-off run reports
+                # the failure instead of retrying forever.
+                if options["once"]:
+                    raise CommandError(f"Draining the outbox failed: {e}")
+                errors += 1
+                delay = retry_delay(errors).total_seconds()
+                logger.exception(
+                    "Draining the outbox failed, retrying in %ss", delay
+                )
+                close_old_connections()
+                time.sleep(delay)
+                continue
+            errors = 0
+            if sent:
+                self.stdout.write(f"Processed {sent} outbox row(s).")
+                continue
+            if options["once"]:
+                return
+            time.sleep(interval)
@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import versions
+from .models import TriggerWord
+from .normalization import fold_char, is_word_char, normalize
+
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple("Match", ["word", "category", "start", "end"])
+
+
+class BaseMatcher:
+    # Scoring shared by the matchers. Subclasses provide iter_matches(),
+    # the words and categories sequences, the normalized pattern lengths
+    # and the size of the scan window.
+
+    def __len__(self):
+        return len(self.words)
+
+    def iter_matches(self, text):
+        raise NotImplementedError
+
+    def _match(self, pattern, start, origins):
+        size = self._window
+        end = start + self._lengths[pattern]
+        return Match(
+            self.words[pattern],
+            self.categories[pattern],
+            origins[start % size],
+            origins[(end - 1) % size] + 1,
+        )
+
+    def contains_any(self, text):
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+    def scan(self, text):
+        # Collect the matches and score them per category in the same pass.
+        # A category flags the text once its match count reaches its
+        # threshold from MODERATION_CATEGORY_THRESHOLDS.
+        thresholds = getattr(settings, "MODERATION_CATEGORY_THRESHOLDS", {})
+        default_threshold = getattr(
+            settings, "MODERATION_DEFAULT_CATEGORY_THRESHOLD", 1
+        )
+
+        matches = []
+        counts = {}
+        for match in self.iter_matches(text):
+            matches.append(match._asdict())
+            counts[match.category] = counts.get(match.category, 0) + 1
+
+        categories = {}
+        for category, count in counts.items():
+            threshold = thresholds.get(category, default_threshold)
+            categories[category] = {
+                "count": count,
+                "threshold": threshold,
+                "flagged": count >= threshold,
+            }
+
+        return {
+            "flagged": any(c["flagged"] for c in categories.values()),
+            "matches": matches,
+            "categories": categories,
+        }
+
+
+class TriggerWordMatcher(BaseMatcher):
+    # Aho-Corasick automaton built from (word, category, whole_word)
+    # entries. Every word is normalized and compiled into a single trie with
+    # failure links, and the text is normalized character by character as
+    # it is scanned, so checking a text is one pass over its characters no
+    # matter how many words there are.
+
+    def __init__(self, words):
+        self.words = []
+        self.categories = []
+        self._lengths = []
+        self._whole_word = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for entry in words:
+            self._add_word(*entry)
+        self._build_failure_links()
+
+        # Recent characters the scan must remember for boundary checks
+        self._window = max(self._lengths, default=0) + 1
+
+    def _add_word(self, word, category, whole_word=False):
+        pattern = normalize(word)
+        if not pattern:
+            # An empty pattern would match every text
+            return
+
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+
+        self._output[state] += (len(self.words),)
+        self.words.append(word)
+        self.categories.append(category)
+        self._lengths.append(len(pattern))
+        self._whole_word.append(whole_word)
+
+    def _build_failure_links(self):
+        # Breadth-first over the trie so a state's failure target is always
+        # final before its children are linked.
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, child in self._goto[state].items():
+                queue.append(child)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+
+                self._fail[child] = target
+                self._output[child] += self._output[target]
+
+    def iter_matches(self, text):
+        # Yield a Match for every occurrence. Offsets point into the
+        # original text, with end being exclusive.
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        lengths = self._lengths
+        whole_word = self._whole_word
+
+        # Ring buffers of the last few normalized characters and the index
+        # in text each one came from
+        size = self._window
+        chars = [" "] * size
+        origins = [0] * size
+        position = 0
+
+        # Whole-word matches waiting to see the character after them
+        pending = []
+
+        state = 0
+        for index, raw in enumerate(text):
+            for char in fold_char(raw):
+                if char == " " and chars[(position - 1) % size] == " ":
+                    continue
+
+                if pending:
+                    if not is_word_char(char):
+                        for pattern, start in pending:
+                            yield self._match(pattern, start, origins)
+                    pending = []
+
+                slot = position % size
+                chars[slot] = char
+                origins[slot] = index
+                position += 1
+
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+
+                for pattern in output[state]:
+                    start = position - lengths[pattern]
+                    if not whole_word[pattern]:
+                        yield self._match(pattern, start, origins)
+                    elif not (
+                        start and is_word_char(chars[(start - 1) % size])
+                    ):
+                        pending.append((pattern, start))
+
+        for pattern, start in pending:
+            yield self._match(pattern, start, origins)
+
+
+_cache_lock = threading.Lock()
+_cached_matcher = None
+_cached_version = None
+_checked_at = 0.0
+
+
+def get_matcher():
+    # Each worker keeps its own compiled matcher and only rebuilds it when
+    # the trigger word version changes. The version itself is re-read at
+    # most every MODERATION_MATCHER_VERSION_TTL seconds, which bounds how
+    # long another worker's edit can go unnoticed.
+    global _cached_matcher, _cached_version, _checked_at
+
+    ttl = getattr(settings, "MODERATION_MATCHER_VERSION_TTL", 5)
+    now = time.monotonic()
+    matcher = _cached_matcher
+    if matcher is not None and now - _checked_at < ttl:
+        return matcher
+
+    with _cache_lock:
+        version = versions.get_version(versions.TRIGGER_WORDS)
+        if _cached_matcher is None or version != _cached_version:
+            _cached_matcher = _load_matcher(version)
+            _cached_version = version
+        elif _snapshot_path() and not _is_snapshot(_cached_matcher):
+            # Built locally while the snapshot was missing or stale; switch
+            # to the shared copy once it has caught up
+            from .snapshot import open_snapshot
+
+            _cached_matcher = (
+                open_snapshot(_snapshot_path(), version) or _cached_matcher
+            )
+        _checked_at = now
+        return _cached_matcher
+
+
+def build_matcher():
+    # Compile the current trigger words. Callers read the version first, so
+    # a matcher is never older than the version it is stored under.
+    words = TriggerWord.objects.order_by("id").values_list(
+        "word", "category", "whole_word"
+    )
+    return TriggerWordMatcher(words)
+
+
+def _snapshot_path():
+    return getattr(settings, "MODERATION_MATCHER_SNAPSHOT_PATH", None)
+
+
+def _is_snapshot(matcher):
+    from .snapshot import SnapshotMatcher
+
+    return isinstance(matcher, SnapshotMatcher)
+
+
+def _load_matcher(version):
+    # With MODERATION_MATCHER_SNAPSHOT_PATH set, workers share one mapped
+    # snapshot. The first worker to see a new version builds the matcher
+    # and publishes it for the others.
+    path = _snapshot_path()
+    if not path:
+        return build_matcher()
+
+    from .snapshot import open_snapshot, write_snapshot
+
+    matcher = open_snapshot(path, version)
+    if matcher is not None:
+        return matcher
+    built = build_matcher()
+    try:
+        write_snapshot(path, built, version)
+    except OSError:
+        logger.exception("Could not write matcher snapshot %s", path)
+        return built
+    return open_snapshot(path, version) or built
+
+
+async def aget_matcher():
+    # Async form of get_matcher. A fresh cached matcher is returned
+    # directly; only a version check or rebuild goes to a thread.
+    ttl = getattr(settings, "MODERATION_MATCHER_VERSION_TTL", 5)
+    matcher = _cached_matcher
+    if matcher is not None and time.monotonic() - _checked_at < ttl:
+        return matcher
+    return await sync_to_async(get_matcher)()
+
+
+def invalidate_matcher():
+    # Drop this worker's copy so the next check rebuilds straight away
+    global _cached_matcher, _cached_version
+
+    with _cache_lock:
+        _cached_matcher = None
+        _cached_version = None
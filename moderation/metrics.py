@@ -0,0 +1,237 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+# Per-request timings, phase -> [seconds, calls]. Only set while the
+# middleware is handling a request, so timed() and the query timer cost a
+# single ContextVar lookup everywhere else.
+_timings = ContextVar("moderation_timings", default=None)
+
+# Prometheus' default buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _add(timings, phase, seconds):
+    entry = timings.get(phase)
+    if entry is None:
+        timings[phase] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def timed(phase):
+    # Add the time spent in the block to `phase` for the current request
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        _add(timings, phase, perf_counter() - started)
+
+
+def query_timer(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _add(timings, "db", perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_timer(connection, **kwargs):
+    # Installed on every connection rather than per request, so queries
+    # run from sync_to_async threads are counted as well
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_timer)
+
+
+class Histogram:
+    # Cumulative-bucket histogram keyed by a tuple of label values
+
+    def __init__(self, name, help_text, labels, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [
+                    [0] * len(self.buckets),
+                    0.0,
+                    0,
+                ]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._series.items()
+            )
+        for label_values, (counts, total, count) in series:
+            labels = _labels(self.labels, label_values)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} '
+                    f"{bucket_count}"
+                )
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+REQUEST_DURATION = Histogram(
+    "moderation_request_duration_seconds",
+    "Time to handle a request.",
+    ("route", "method", "status"),
+)
+PHASE_DURATION = Histogram(
+    "moderation_request_phase_seconds",
+    "Time a request spent in each phase.",
+    ("route", "phase"),
+)
+DB_QUERIES = Histogram(
+    "moderation_request_db_queries",
+    "Database queries run by a request.",
+    ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500),
+)
+
+
+def _route(request):
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    # Times every request and its phases. Results go to the histograms
+    # served by metrics_view and, with MODERATION_SERVER_TIMING, to a
+    # Server-Timing response header.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = {}
+        token = _timings.set(timings)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        self.finish(request, response, timings, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timings = {}
+        token = _timings.set(timings)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        self.finish(request, response, timings, perf_counter() - started)
+        return response
+
+    def finish(self, request, response, timings, total):
+        route = _route(request)
+        REQUEST_DURATION.observe(
+            (route, request.method, str(response.status_code)), total
+        )
+        for phase, (seconds, _) in timings.items():
+            PHASE_DURATION.observe((route, phase), seconds)
+        queries = timings.get("db", (0, 0))[1]
+        DB_QUERIES.observe((route,), queries)
+
+        if getattr(settings, "MODERATION_SERVER_TIMING", settings.DEBUG):
+            entries = [
+                f'{phase};dur={seconds * 1000:.2f};desc="{calls} calls"'
+                for phase, (seconds, calls) in timings.items()
+            ]
+            entries.append(f"total;dur={total * 1000:.2f}")
+            response["Server-Timing"] = ", ".join(entries)
+
+
+def metrics_view(request):
+    # Prometheus text exposition of this worker's metrics
+    token = getattr(settings, "MODERATION_METRICS_TOKEN", None)
+    if not token and not settings.DEBUG:
+        # Not published without a token outside development
+        return HttpResponse(status=404)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+
+    from .authentication import token_cache
+
+    lines = []
+    for histogram in (REQUEST_DURATION, PHASE_DURATION, DB_QUERIES):
+        lines.extend(histogram.render())
+
+    stats = token_cache.stats()
+    for name, help_text in (
+        ("hits", "Requests served from the verified-token cache."),
+        ("misses", "Requests that had to verify their token."),
+    ):
+        metric = f"moderation_token_cache_{name}_total"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {stats[name]}")
+
+    return HttpResponse(
+        "\n".join(lines) + "\n",
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
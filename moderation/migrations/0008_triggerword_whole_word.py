@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0007_cacheversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="triggerword",
+            name="whole_word",
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:16
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_dedup_keys(apps, schema_editor):
+    # Key the oldest row of each (post, comment, reply, reason) group.
+    # Rows that were already duplicates keep a NULL key and stay as they are.
+    FlaggedContent = apps.get_model("moderation", "FlaggedContent")
+    seen = set()
+    rows = FlaggedContent.objects.order_by("id").values_list(
+        "id", "post_id", "comment_id", "reply_id", "reason"
+    )
+    for pk, post_id, comment_id, reply_id, reason in rows.iterator():
+        parts = [post_id or "", comment_id or "", reply_id or "", reason]
+        key = hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+        if key in seen:
+            continue
+        seen.add(key)
+        FlaggedContent.objects.filter(pk=pk).update(dedup_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0008_triggerword_whole_word"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="flaggedcontent",
+            name="dedup_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="flaggedcontent",
+            name="report_count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(fill_dedup_keys, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="FlagIdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, unique=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "flagged_content",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="moderation.flaggedcontent",
+                    ),
+                ),
+            ],
+        ),
+    ]
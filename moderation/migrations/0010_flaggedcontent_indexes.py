@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0009_flaggedcontent_dedup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                condition=models.Q(("reviewed", False)),
+                fields=["flagged_at", "id"],
+                name="flagged_unreviewed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                fields=["post_id", "comment_id", "reply_id"],
+                name="flagged_parent_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0010_flaggedcontent_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                fields=["flagged_at", "id"], name="flagged_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                fields=["user", "flagged_at", "id"], name="flagged_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                fields=["reason", "flagged_at", "id"],
+                name="flagged_reason_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="flaggedcontent",
+            index=models.Index(
+                fields=["is_visible", "flagged_at", "id"],
+                name="flagged_visible_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0011_flaggedcontent_list_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FirestoreOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("document_path", models.CharField(max_length=500)),
+                ("data", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                ("failed", models.BooleanField(default=False)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("failed", False)),
+                        fields=["next_attempt_at", "id"],
+                        name="outbox_pending_idx",
+                    ),
+                    models.Index(
+                        fields=["document_path"], name="outbox_path_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_counts(apps, schema_editor):
+    # Count the existing rows once with GROUP BY queries; from here on the
+    # counters are updated by every write
+    FlaggedContent = apps.get_model("moderation", "FlaggedContent")
+    FlaggedContentCount = apps.get_model("moderation", "FlaggedContentCount")
+
+    counts = [("total", "", FlaggedContent.objects.count())]
+    for field in ("reviewed", "is_visible"):
+        rows = FlaggedContent.objects.values_list(field).annotate(
+            n=Count("id")
+        )
+        counts.extend(
+            (field, "true" if value else "false", n) for value, n in rows
+        )
+    rows = FlaggedContent.objects.values_list("reason").annotate(n=Count("id"))
+    counts.extend(("reason", reason, n) for reason, n in rows)
+    rows = (
+        FlaggedContent.objects.annotate(day=TruncDate("flagged_at"))
+        .values_list("day")
+        .annotate(n=Count("id"))
+    )
+    counts.extend(("day", day.isoformat(), n) for day, n in rows)
+
+    FlaggedContentCount.objects.bulk_create(
+        [
+            FlaggedContentCount(dimension=dimension, value=value, count=n)
+            for dimension, value, n in counts
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0012_firestoreoutbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlaggedContentCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dimension", models.CharField(max_length=20)),
+                ("value", models.CharField(max_length=255)),
+                ("count", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="flaggedcontentcount",
+            constraint=models.UniqueConstraint(
+                fields=("dimension", "value"), name="flagged_count_key"
+            ),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0013_flaggedcontentcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="firestoreoutbox",
+            name="leased_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
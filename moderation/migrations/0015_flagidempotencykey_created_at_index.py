@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("moderation", "0014_firestoreoutbox_leased_until"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="flagidempotencykey",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
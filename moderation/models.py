@@ -1,8 +1,11 @@
+import hashlib
+
 from django.db import models
+from django.utils import timezone
 
 
 class FlaggedContent(models.Model):
-    # Model to store flagged content, with fields for post, 
+    # Model to store flagged content, with fields for post,
     # comment, and reply IDs.
     post_id = models.CharField(max_length=100)  # Firebase post ID
     content = models.TextField()
@@ -19,18 +22,139 @@ class FlaggedContent(models.Model):
     reply_id = models.CharField(
         max_length=100, null=True, blank=True
     )  # Optional reply ID
+    # Repeat reports of the same content and reason are counted here
+    # instead of being stored as new rows
+    report_count = models.PositiveIntegerField(default=1)
+    dedup_key = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
+
+    class Meta:
+        indexes = [
+            # Moderation queue: unreviewed items, oldest first
+            models.Index(
+                fields=["flagged_at", "id"],
+                condition=models.Q(reviewed=False),
+                name="flagged_unreviewed_idx",
+            ),
+            # Filtered listings, all keyed on the pagination order
+            models.Index(fields=["flagged_at", "id"], name="flagged_at_idx"),
+            models.Index(
+                fields=["user", "flagged_at", "id"], name="flagged_user_idx"
+            ),
+            models.Index(
+                fields=["reason", "flagged_at", "id"],
+                name="flagged_reason_idx",
+            ),
+            models.Index(
+                fields=["is_visible", "flagged_at", "id"],
+                name="flagged_visible_idx",
+            ),
+            # Lookups of the flags for a post, comment or reply
+            models.Index(
+                fields=["post_id", "comment_id", "reply_id"],
+                name="flagged_parent_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Flagged by {self.user} for {self.reason}"
 
+    @staticmethod
+    def make_dedup_key(post_id, comment_id, reply_id, reason):
+        parts = [post_id or "", comment_id or "", reply_id or "", reason]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.dedup_key is None:
+            self.dedup_key = self.make_dedup_key(
+                self.post_id, self.comment_id, self.reply_id, self.reason
+            )
+        super().save(*args, **kwargs)
+
+
+class FlagIdempotencyKey(models.Model):
+    # Idempotency-Key header values already used to report content, so a
+    # retried request returns the original result instead of counting twice
+    key = models.CharField(max_length=255, unique=True)
+    flagged_content = models.ForeignKey(
+        FlaggedContent, on_delete=models.CASCADE, related_name="+"
+    )
+    # Keys expire after MODERATION_IDEMPOTENCY_KEY_TTL seconds
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class FlaggedContentCount(models.Model):
+    # Number of flagged content rows per (dimension, value), e.g.
+    # ("reviewed", "false") or ("day", "2024-05-01"), kept up to date by
+    # every write so the stats endpoint never has to count the table
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=255)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "value"], name="flagged_count_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.value}: {self.count}"
+
+
+class FirestoreOutbox(models.Model):
+    # Firestore updates waiting to be sent by the sync_firestore worker.
+    # Rows are written in the same transaction as the change they mirror.
+    document_path = models.CharField(max_length=500)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Set once the update has used up its retries
+    failed = models.BooleanField(default=False)
+    # Set while a worker is sending the row; the lease expires on its own
+    # if the worker dies mid-send
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                condition=models.Q(failed=False),
+                name="outbox_pending_idx",
+            ),
+            models.Index(fields=["document_path"], name="outbox_path_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.document_path} ({self.attempts} attempts)"
+
 
 # TriggerWord model
 class TriggerWord(models.Model):
     # Model to store trigger words that will be flagged in content.
     word = models.CharField(max_length=100, unique=True)  # Trigger word
     category = models.CharField(max_length=100)  # Category (e.g., "self-harm")
+    # Only match the word when it is not part of a longer word
+    whole_word = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.word} ({self.category})"
+
+
+class CacheVersion(models.Model):
+    # Generation counter bumped whenever a cached table changes, so every
+    # worker can tell when its in-process copy is stale.
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
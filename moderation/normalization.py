@@ -0,0 +1,94 @@
+import unicodedata
+
+# Letters from other scripts that are commonly swapped in for Latin ones.
+# Keys are already case-folded.
+HOMOGLYPHS = {
+    # Cyrillic
+    "а": "a",
+    "в": "b",
+    "е": "e",
+    "һ": "h",
+    "н": "h",
+    "і": "i",
+    "ј": "j",
+    "к": "k",
+    "м": "m",
+    "о": "o",
+    "р": "p",
+    "ԛ": "q",
+    "ѕ": "s",
+    "с": "c",
+    "т": "t",
+    "у": "y",
+    "ԝ": "w",
+    "х": "x",
+    "ԁ": "d",
+    # Greek
+    "α": "a",
+    "β": "b",
+    "ε": "e",
+    "ι": "i",
+    "κ": "k",
+    "ν": "v",
+    "ο": "o",
+    "ρ": "p",
+    "τ": "t",
+    "υ": "u",
+    "χ": "x",
+}
+
+# Leetspeak substitutions
+LEETSPEAK = {
+    "0": "o",
+    "1": "i",
+    "3": "e",
+    "4": "a",
+    "5": "s",
+    "7": "t",
+    "@": "a",
+    "$": "s",
+}
+
+# Combining marks and invisible format characters (zero-width joiners,
+# soft hyphens, byte order marks) are dropped entirely
+STRIPPED_CATEGORIES = {"Mn", "Me", "Cf"}
+
+_folded = {}
+
+
+def fold_char(char):
+    # Fold one character to the text the matcher compares against. The
+    # result may be empty (stripped) or longer than one character.
+    folded = _folded.get(char)
+    if folded is not None:
+        return folded
+
+    if char.isspace():
+        folded = " "
+    else:
+        parts = []
+        for part in unicodedata.normalize("NFKD", char).casefold():
+            if unicodedata.category(part) in STRIPPED_CATEGORIES:
+                continue
+            part = HOMOGLYPHS.get(part, part)
+            parts.append(LEETSPEAK.get(part, part))
+        folded = "".join(parts)
+
+    _folded[char] = folded
+    return folded
+
+
+def normalize(text):
+    # Whole-string form of fold_char, with whitespace runs collapsed the
+    # same way the matcher collapses them while scanning
+    normalized = []
+    for char in text:
+        for part in fold_char(char):
+            if part == " " and (not normalized or normalized[-1] == " "):
+                continue
+            normalized.append(part)
+    return "".join(normalized).rstrip(" ")
+
+
+def is_word_char(char):
+    return char.isalnum() or char == "_"
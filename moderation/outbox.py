@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+from .metrics import timed
+from .models import FirestoreOutbox
+
+
+def enqueue_update(path, data):
+    # Call inside the transaction that makes the local change, so the
+    # Firestore update is queued if and only if the change commits
+    return FirestoreOutbox.objects.create(document_path=path, data=data)
+
+
+def enqueue_updates(updates):
+    # Bulk form of enqueue_update for (path, data) pairs
+    return FirestoreOutbox.objects.bulk_create(
+        [
+            FirestoreOutbox(document_path=path, data=data)
+            for path, data in updates
+        ],
+        batch_size=500,
+    )
+
+
+async def send_now(entry, gateway):
+    # Deliver a freshly queued update without waiting for the worker and
+    # return whether it went out. The row is only removed when no other
+    # update for the document is pending; otherwise the worker sends the
+    # merged state, so concurrent changes still land in order.
+    try:
+        with timed("firestore"):
+            await gateway.update_async(entry.document_path, entry.data)
+    except Exception:
+        return False
+
+    others = FirestoreOutbox.objects.filter(
+        document_path=entry.document_path, failed=False
+    ).exclude(pk=entry.pk)
+    await FirestoreOutbox.objects.filter(pk=entry.pk).filter(
+        ~Exists(others)
+    ).adelete()
+    return True
+
+
+def retry_delay(attempts):
+    # Exponential backoff, capped
+    base = getattr(settings, "MODERATION_OUTBOX_RETRY_DELAY", 2)
+    cap = getattr(settings, "MODERATION_OUTBOX_MAX_RETRY_DELAY", 300)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def drain_outbox(gateway, batch_size=None):
+    # Send one batch of due updates and return how many rows it covered.
+    # Every pending row for a document is merged in id order, so several
+    # queued changes to the same document go out as one write and an older
+    # update can never land after a newer one.
+    #
+    # No transaction is open while Firestore is called: the rows are
+    # leased in one short transaction and deleted or rescheduled in
+    # another, so API writers never wait on the network round-trip.
+    max_attempts = getattr(settings, "MODERATION_OUTBOX_MAX_ATTEMPTS", 10)
+    now = timezone.now()
+    rows = _lease(batch_size, now)
+    if not rows:
+        return 0
+
+    documents = {}
+    for row in rows:
+        data, queued = documents.setdefault(row.document_path, ({}, []))
+        data.update(row.data)
+        queued.append(row)
+
+    updates = [(path, data) for path, (data, _) in documents.items()]
+    try:
+        failed = gateway.batch_update(updates)
+    except Exception as e:
+        failed = {path: e for path, _ in updates}
+
+    sent = [
+        row.id
+        for path, (_, queued) in documents.items()
+        if path not in failed
+        for row in queued
+    ]
+    retries = []
+    for path, error in failed.items():
+        for row in documents[path][1]:
+            row.attempts += 1
+            row.last_error = str(error)
+            row.next_attempt_at = now + retry_delay(row.attempts)
+            row.failed = row.attempts >= max_attempts
+            row.leased_until = None
+            retries.append(row)
+
+    with transaction.atomic():
+        FirestoreOutbox.objects.filter(id__in=sent).delete()
+        FirestoreOutbox.objects.bulk_update(
+            retries,
+            [
+                "attempts",
+                "last_error",
+                "next_attempt_at",
+                "failed",
+                "leased_until",
+            ],
+        )
+    return len(rows)
+
+
+def _lease(batch_size, now):
+    # Lease every pending row of up to batch_size due documents. Documents
+    # with rows leased by another worker are skipped, so each document has
+    # at most one write in flight; a worker that dies mid-send leaves its
+    # lease to expire and the rows are picked up again.
+    batch_size = batch_size or getattr(
+        settings, "MODERATION_OUTBOX_BATCH_SIZE", 500
+    )
+    lease = getattr(settings, "MODERATION_OUTBOX_LEASE", 60)
+
+    with transaction.atomic():
+        pending = FirestoreOutbox.objects.filter(failed=False)
+        in_flight = pending.filter(leased_until__gt=now).values(
+            "document_path"
+        )
+        paths = set(
+            pending.filter(next_attempt_at__lte=now)
+            .exclude(document_path__in=in_flight)
+            .order_by("next_attempt_at", "id")
+            .values_list("document_path", flat=True)[:batch_size]
+        )
+        if not paths:
+            return []
+
+        rows = list(
+            pending.select_for_update(skip_locked=True)
+            .filter(document_path__in=paths)
+            .order_by("id")
+        )
+        FirestoreOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+            leased_until=now + timedelta(seconds=lease)
+        )
+    return rows
@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class FlaggedContentCursorPagination(CursorPagination):
+    # Keyset pagination over (flagged_at, id), so fetching a page costs the
+    # same no matter how deep into the table it is
+    ordering = ("flagged_at", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
@@ -0,0 +1,10 @@
+from rest_framework.parsers import BaseParser
+
+
+class CSVTextParser(BaseParser):
+    # Hands a text/csv body to the view as a string
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        return stream.read().decode(encoding)
@@ -0,0 +1,50 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    # Optional: without it FastJSONRenderer is plain JSONRenderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer that encodes with orjson when it is installed, writing
+    # the same bytes as JSONRenderer's compact, unescaped output. Values
+    # DRF's encoder formats itself, such as datetimes and decimals, make
+    # orjson raise, and then fall back to JSONRenderer.
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these so the output is valid JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class ExportRenderer(JSONRenderer):
+    # Lets content negotiation accept an export's own media type. The
+    # export itself is a streamed response that the view builds, so only
+    # error responses are rendered here, as JSON.
+    pass
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from .models import FlaggedContent, TriggerWord
 
@@ -16,10 +18,42 @@ class FlaggedContentSerializer(serializers.ModelSerializer):
             "reviewed",
             "content",
             "is_visible",
+            "report_count",
         ]
 
 
 class TriggerWordSerializer(serializers.ModelSerializer):
     class Meta:
         model = TriggerWord
-        fields = ["id", "word", "category", "created_at", "updated_at"]
+        fields = [
+            "id",
+            "word",
+            "category",
+            "whole_word",
+            "created_at",
+            "updated_at",
+        ]
+
+
+# Read-only fast path for list and export responses: .values() rows of
+# exactly the declared fields, turned into the same dicts as
+# FlaggedContentSerializer(instance).data without building instances or
+# running the serializer fields
+def flagged_content_values(queryset):
+    return queryset.values(*FlaggedContentSerializer.Meta.fields)
+
+
+def flagged_content_rows(rows):
+    # Only flagged_at needs converting; every other column already has
+    # the type its serializer field returns. The current timezone is
+    # looked up once rather than per row, and each row is copied because
+    # cursor pagination reads flagged_at from the page afterwards.
+    flagged_at = serializers.DateTimeField(
+        default_timezone=(
+            timezone.get_current_timezone() if settings.USE_TZ else None
+        )
+    )
+    for values in rows:
+        row = dict(values)
+        row["flagged_at"] = flagged_at.to_representation(row["flagged_at"])
+        yield row
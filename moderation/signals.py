@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import matcher, versions
+from .models import TriggerWord
+
+# Set while a batch of trigger word changes is being applied
+_batch = ContextVar("trigger_word_batch", default=None)
+
+
+@contextmanager
+def trigger_word_batch():
+    # Apply many trigger word changes in one transaction with a single
+    # version bump. Per-row signals inside the block only mark the batch
+    # as changed; bulk_create and bulk_update send no signals, so callers
+    # using them set state["changed"] themselves. Nested batches join the
+    # outermost one.
+    state = _batch.get()
+    if state is not None:
+        yield state
+        return
+
+    state = {"changed": False}
+    token = _batch.set(state)
+    try:
+        with transaction.atomic():
+            yield state
+            if state["changed"]:
+                versions.bump_version(versions.TRIGGER_WORDS)
+                transaction.on_commit(matcher.invalidate_matcher)
+    finally:
+        _batch.reset(token)
+
+
+@receiver(post_save, sender=TriggerWord)
+@receiver(post_delete, sender=TriggerWord)
+def trigger_words_changed(sender, **kwargs):
+    # Covers the viewset and the admin, which both go through the model
+    batch = _batch.get()
+    if batch is not None:
+        batch["changed"] = True
+        return
+    versions.bump_version(versions.TRIGGER_WORDS)
+    matcher.invalidate_matcher()
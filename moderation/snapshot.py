@@ -0,0 +1,294 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+from .matcher import BaseMatcher
+from .normalization import fold_char, is_word_char
+
+logger = logging.getLogger(__name__)
+
+# A snapshot is a compiled TriggerWordMatcher laid out as flat uint32
+# arrays so that workers can mmap it read-only and share its pages:
+#
+#   header        magic, format, byte order, trigger word version, counts
+#   edge_index    states + 1   CSR offsets into edge_chars/edge_targets
+#   edge_chars    edges        code point of each edge, sorted per state
+#   edge_targets  edges        state each edge leads to
+#   fail          states       failure link of each state
+#   output_index  states + 1   CSR offsets into outputs
+#   outputs       outputs      word indices matched at each state
+#   lengths       words        normalized length of each word
+#   whole_word    words        1 for whole-word entries
+#   category_ids  words        index into the category strings
+#   string_index  words + categories + 1   offsets into the UTF-8 strings
+#   strings       the words, then the categories
+MAGIC = b"TWMS"
+FORMAT = 1
+HEADER = struct.Struct("=4sBBxxQIIIIII")
+BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+
+
+def serialize(matcher, version):
+    # Flatten a TriggerWordMatcher into snapshot bytes
+    edge_index = [0]
+    edge_chars = []
+    edge_targets = []
+    for edges in matcher._goto:
+        for char in sorted(edges):
+            edge_chars.append(ord(char))
+            edge_targets.append(edges[char])
+        edge_index.append(len(edge_chars))
+
+    output_index = [0]
+    outputs = []
+    for output in matcher._output:
+        outputs.extend(output)
+        output_index.append(len(outputs))
+
+    categories = list(dict.fromkeys(matcher.categories))
+    category_ids = {category: i for i, category in enumerate(categories)}
+    strings = bytearray()
+    string_index = [0]
+    for value in chain(matcher.words, categories):
+        strings += value.encode("utf-8")
+        string_index.append(len(strings))
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT,
+        BYTE_ORDER,
+        version,
+        len(matcher._goto),
+        len(edge_chars),
+        len(matcher.words),
+        len(outputs),
+        len(categories),
+        matcher._window,
+    )
+    sections = [
+        edge_index,
+        edge_chars,
+        edge_targets,
+        matcher._fail,
+        output_index,
+        outputs,
+        matcher._lengths,
+        [int(whole) for whole in matcher._whole_word],
+        [category_ids[category] for category in matcher.categories],
+        string_index,
+    ]
+    return b"".join(
+        [header]
+        + [array("I", section).tobytes() for section in sections]
+        + [bytes(strings)]
+    )
+
+
+def read_version(path):
+    # Trigger word version of the snapshot at path, or None when there is
+    # no usable snapshot. Only the header is read.
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, fmt, byte_order, version = HEADER.unpack(header)[:4]
+    if magic != MAGIC or fmt != FORMAT or byte_order != BYTE_ORDER:
+        return None
+    return version
+
+
+def write_snapshot(path, matcher, version):
+    # Publish a snapshot atomically: write a temporary file next to path,
+    # then rename it over path. Workers that already mapped the old file
+    # keep reading it until they swap. A snapshot is never replaced by an
+    # older version.
+    data = serialize(matcher, version)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        current = read_version(path)
+        if current is not None and current > version:
+            os.unlink(temp_path)
+            return False
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return True
+
+
+def open_snapshot(path, version=None):
+    # Map the snapshot at path, or return None if it is missing, invalid
+    # or not for `version`
+    current = read_version(path)
+    if current is None or (version is not None and current != version):
+        return None
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return SnapshotMatcher(buffer)
+    except (OSError, ValueError):
+        # Replaced mid-read or truncated; the next check tries again
+        logger.exception("Could not map matcher snapshot %s", path)
+        return None
+
+
+class _Strings:
+    # Sequence of strings decoded from the snapshot on demand
+
+    def __init__(self, blob, index, start, count, ids=None):
+        self._blob = blob
+        self._index = index
+        self._start = start
+        self._count = count
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids) if self._ids is not None else self._count
+
+    def __getitem__(self, i):
+        if self._ids is not None:
+            i = self._ids[i]
+        i += self._start
+        return str(self._blob[self._index[i] : self._index[i + 1]], "utf-8")
+
+
+class SnapshotMatcher(BaseMatcher):
+    # TriggerWordMatcher read straight from a mapped snapshot. Transitions
+    # are found by binary search over each state's sorted edges, with the
+    # root's edges, which every failed match returns to, kept in a dict.
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        (
+            _,
+            _,
+            _,
+            self.version,
+            states,
+            edges,
+            words,
+            outputs,
+            categories,
+            self._window,
+        ) = HEADER.unpack_from(buffer)
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+        sizes = [
+            states + 1,
+            edges,
+            edges,
+            states,
+            states + 1,
+            outputs,
+            words,
+            words,
+            words,
+            words + categories + 1,
+        ]
+        if len(view) < offset + sum(sizes) * 4:
+            raise ValueError("Truncated matcher snapshot")
+        sections = []
+        for size in sizes:
+            end = offset + size * 4
+            sections.append(view[offset:end].cast("I"))
+            offset = end
+        (
+            self._edge_index,
+            self._edge_chars,
+            self._edge_targets,
+            self._fail,
+            self._output_index,
+            self._outputs,
+            self._lengths,
+            self._whole_word,
+            category_ids,
+            string_index,
+        ) = sections
+        blob = view[offset:]
+        if len(blob) != string_index[-1]:
+            raise ValueError("Truncated matcher snapshot")
+
+        self.words = _Strings(blob, string_index, 0, words)
+        self.categories = _Strings(
+            blob, string_index, words, categories, category_ids
+        )
+        self._root = {
+            chr(self._edge_chars[i]): self._edge_targets[i]
+            for i in range(self._edge_index[0], self._edge_index[1])
+        }
+
+    def iter_matches(self, text):
+        # Same scan as TriggerWordMatcher.iter_matches, over the flat arrays
+        edge_index = self._edge_index
+        edge_chars = self._edge_chars
+        edge_targets = self._edge_targets
+        fail = self._fail
+        output_index = self._output_index
+        outputs = self._outputs
+        lengths = self._lengths
+        whole_word = self._whole_word
+        root = self._root
+
+        size = self._window
+        chars = [" "] * size
+        origins = [0] * size
+        position = 0
+        pending = []
+
+        state = 0
+        for index, raw in enumerate(text):
+            for char in fold_char(raw):
+                if char == " " and chars[(position - 1) % size] == " ":
+                    continue
+
+                if pending:
+                    if not is_word_char(char):
+                        for pattern, start in pending:
+                            yield self._match(pattern, start, origins)
+                    pending = []
+
+                slot = position % size
+                chars[slot] = char
+                origins[slot] = index
+                position += 1
+
+                code = ord(char)
+                while state:
+                    low = edge_index[state]
+                    high = edge_index[state + 1]
+                    i = bisect_left(edge_chars, code, low, high)
+                    if i < high and edge_chars[i] == code:
+                        state = edge_targets[i]
+                        break
+                    state = fail[state]
+                else:
+                    state = root.get(char, 0)
+
+                for k in range(output_index[state], output_index[state + 1]):
+                    pattern = outputs[k]
+                    start = position - lengths[pattern]
+                    if not whole_word[pattern]:
+                        yield self._match(pattern, start, origins)
+                    elif not (
+                        start and is_word_char(chars[(start - 1) % size])
+                    ):
+                        pending.append((pattern, start))
+
+        for pattern, start in pending:
+            yield self._match(pattern, start, origins)
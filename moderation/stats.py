@@ -0,0 +1,215 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import versions
+from .models import FlaggedContent, FlaggedContentCount
+
+# Fields of a flagged content row that its counters depend on
+COUNTED_FIELDS = ("reviewed", "is_visible", "reason", "flagged_at")
+
+
+def _flag(value):
+    return "true" if value else "false"
+
+
+def counter_keys(reviewed, is_visible, reason, flagged_at):
+    # The (dimension, value) counters a row with these fields adds to
+    return [
+        ("total", ""),
+        ("reviewed", _flag(reviewed)),
+        ("is_visible", _flag(is_visible)),
+        ("reason", reason),
+        ("day", timezone.localdate(flagged_at).isoformat()),
+    ]
+
+
+def count_rows(rows, sign=1, deltas=None):
+    # Add `sign` to the counters of every row, given as tuples of
+    # COUNTED_FIELDS, and return the deltas
+    deltas = Counter() if deltas is None else deltas
+    for row in rows:
+        for key in counter_keys(*row):
+            deltas[key] += sign
+    return deltas
+
+
+def row_values(instance):
+    return tuple(getattr(instance, field) for field in COUNTED_FIELDS)
+
+
+# Primary keys of counters this worker has seen committed. Counters are
+# never deleted, only reset in place by recount(), so a known key always
+# points at a live row.
+_known_ids = {}
+
+
+def _counter_ids(keys):
+    ids = {key: _known_ids[key] for key in keys if key in _known_ids}
+    missing = [key for key in keys if key not in ids]
+    if missing:
+        FlaggedContentCount.objects.bulk_create(
+            [
+                FlaggedContentCount(dimension=dimension, value=value)
+                for dimension, value in missing
+            ],
+            ignore_conflicts=True,
+        )
+        condition = Q()
+        for dimension, value in missing:
+            condition |= Q(dimension=dimension, value=value)
+        found = {
+            (dimension, value): pk
+            for dimension, value, pk in FlaggedContentCount.objects.filter(
+                condition
+            ).values_list("dimension", "value", "id")
+        }
+        ids.update(found)
+        # Rows created here disappear if the transaction rolls back
+        transaction.on_commit(lambda: _known_ids.update(found))
+    return ids
+
+
+def apply_deltas(deltas):
+    # Add the deltas to the counter table. Call inside the transaction
+    # that makes the change being counted, after the flagged content rows
+    # are written and before the version is bumped: every write path
+    # locks rows, then counters, then the CacheVersion row, so they cannot
+    # deadlock each other. Once a worker knows the counters' ids this is
+    # one UPDATE per distinct delta, usually one or two whatever the
+    # number of rows changed.
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    ids = _counter_ids(list(deltas))
+    by_delta = {}
+    for key, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(ids[key])
+    for delta, pks in by_delta.items():
+        # Rows are updated in id order so concurrent writers lock the
+        # shared counters in the same order
+        FlaggedContentCount.objects.filter(pk__in=sorted(pks)).update(
+            count=F("count") + delta
+        )
+
+
+def update_counted(queryset, **changes):
+    # queryset.update(**changes), adjusting the counters of the rows it
+    # changes and bumping the flagged content version. Returns the number
+    # of rows updated.
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list(*COUNTED_FIELDS))
+        count = queryset.update(**changes)
+        deltas = count_rows(rows, -1)
+        positions = {field: i for i, field in enumerate(COUNTED_FIELDS)}
+        for row in rows:
+            row = list(row)
+            for field, value in changes.items():
+                row[positions[field]] = value
+            count_rows([row], 1, deltas)
+        apply_deltas(deltas)
+        if count:
+            versions.bump_version(versions.FLAGGED_CONTENT)
+    return count
+
+
+def delete_counted(queryset):
+    # queryset.delete(), taking the deleted rows off the counters and
+    # bumping the flagged content version
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list(*COUNTED_FIELDS))
+        deleted = queryset.delete()
+        apply_deltas(count_rows(rows, -1))
+        if rows:
+            versions.bump_version(versions.FLAGGED_CONTENT)
+    return deleted
+
+
+def _count_table():
+    counts = [("total", "", FlaggedContent.objects.count())]
+    for field in ("reviewed", "is_visible"):
+        rows = FlaggedContent.objects.values_list(field).annotate(
+            n=Count("id")
+        )
+        counts.extend((field, _flag(value), n) for value, n in rows)
+    rows = FlaggedContent.objects.values_list("reason").annotate(n=Count("id"))
+    counts.extend(("reason", reason, n) for reason, n in rows)
+    rows = (
+        FlaggedContent.objects.annotate(day=TruncDate("flagged_at"))
+        .values_list("day")
+        .annotate(n=Count("id"))
+    )
+    counts.extend(("day", day.isoformat(), n) for day, n in rows)
+    return counts
+
+
+def recount():
+    # Rebuild every counter from the table with GROUP BY queries, to
+    # repair counters after rows were changed outside the app. Counters
+    # are reset and rewritten in place so their ids stay valid.
+    with transaction.atomic():
+        counts = {
+            (dimension, value): n for dimension, value, n in _count_table()
+        }
+        counters = list(FlaggedContentCount.objects.select_for_update())
+        for counter in counters:
+            counter.count = counts.pop((counter.dimension, counter.value), 0)
+        FlaggedContentCount.objects.bulk_update(
+            counters, ["count"], batch_size=500
+        )
+        FlaggedContentCount.objects.bulk_create(
+            [
+                FlaggedContentCount(dimension=dimension, value=value, count=n)
+                for (dimension, value), n in counts.items()
+            ],
+            batch_size=500,
+        )
+    return len(counters) + len(counts)
+
+
+def queue_stats(days=30):
+    # Dashboard summary read from the counters, plus the oldest unreviewed
+    # row found through the partial unreviewed index
+    since = (timezone.localdate() - timedelta(days=days - 1)).isoformat()
+    counters = FlaggedContentCount.objects.exclude(
+        dimension="day", value__lt=since
+    ).values_list("dimension", "value", "count")
+
+    stats = {
+        "total": 0,
+        "reviewed": {"true": 0, "false": 0},
+        "is_visible": {"true": 0, "false": 0},
+        "reasons": {},
+        "days": {},
+    }
+    sections = {
+        "reviewed": "reviewed",
+        "is_visible": "is_visible",
+        "reason": "reasons",
+        "day": "days",
+    }
+    for dimension, value, count in counters:
+        if dimension == "total":
+            stats["total"] = count
+        elif count:
+            stats[sections[dimension]][value] = count
+    stats["days"] = dict(sorted(stats["days"].items()))
+
+    oldest = (
+        FlaggedContent.objects.filter(reviewed=False)
+        .order_by("flagged_at", "id")
+        .values_list("flagged_at", flat=True)
+        .first()
+    )
+    stats["oldest_unreviewed_at"] = oldest
+    stats["oldest_unreviewed_age"] = (
+        None
+        if oldest is None
+        else max(0, int((timezone.now() - oldest).total_seconds()))
+    )
+    return stats
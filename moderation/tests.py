@@ -1,18 +1,78 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+from asgiref.sync import async_to_sync
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
-from unittest.mock import patch
-from .models import FlaggedContent
+from unittest.mock import MagicMock, patch
+from . import firebase, renderers, versions
+from .admin import FlaggedContentAdmin, approve_flagged_content
+from .authentication import FirebaseAuthentication, token_cache
+from .database import configure_sqlite
+from .flagging import build_flagged_content, record_report, save_review
+from .firestore import (
+    MAX_BATCH_WRITES,
+    FirestoreUnavailable,
+    InMemoryFirestoreGateway,
+    document_path,
+    get_gateway,
+)
+from .keystore import MIN_RELOAD_INTERVAL, PublicKeyStore, warm_up
+from .matcher import TriggerWordMatcher, get_matcher, invalidate_matcher
+from .metrics import REQUEST_DURATION, Histogram
+from .models import (
+    FirestoreOutbox,
+    FlagIdempotencyKey,
+    FlaggedContent,
+    FlaggedContentCount,
+    TriggerWord,
+)
+from .outbox import drain_outbox, enqueue_update, retry_delay, send_now
+from .renderers import FastJSONRenderer
+from .serializers import (
+    FlaggedContentSerializer,
+    flagged_content_rows,
+    flagged_content_values,
+)
+from .snapshot import SnapshotMatcher, open_snapshot, write_snapshot
+from .stats import queue_stats, update_counted
 
 
 class FirebaseAuthTest(APITestCase):
     def setUp(self):
-        # Setup mock Firebase authentication
-        self.mock_firebase_patcher = patch(
-            "firebase_admin.auth.verify_id_token"
-        )
-        self.mock_firebase = self.mock_firebase_patcher.start()
-        self.mock_firebase.return_value = {"uid": "testfirebaseuid"}
+        use_mock_firebase(self)
 
         # Create a test user associated with the Firebase uid
         self.client = APIClient()
@@ -20,9 +80,6 @@ class FirebaseAuthTest(APITestCase):
         self.invalid_token = "invalid.token"
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
 
-    def tearDown(self):
-        self.mock_firebase_patcher.stop()
-
     def test_valid_firebase_auth(self):
         """Ensure Firebase authentication works with a valid token"""
         response = self.client.get(
@@ -92,7 +149,2161 @@ class FirebaseAuthTest(APITestCase):
 
         response = self.client.get(reverse("flaggedcontent-list"))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(
+            response.data["results"][0].get("content", ""),
+            "Test post containing kms",
+        )
+
+
+class TriggerWordMatcherTest(SimpleTestCase):
+    def test_finds_overlapping_words(self):
+        """Every trigger word is reported, including overlapping ones"""
+        matcher = TriggerWordMatcher(
+            [(word, "test") for word in ["he", "she", "hers", "his"]]
+        )
+        matches = [
+            (match.word, match.start, match.end)
+            for match in matcher.iter_matches("ushers")
+        ]
+        self.assertEqual(
+            matches, [("she", 1, 4), ("he", 2, 4), ("hers", 2, 6)]
+        )
+
+    def test_matching_is_case_insensitive(self):
+        """Words and content are compared in lower case"""
+        matcher = TriggerWordMatcher([("KMS", "self-harm")])
+        self.assertTrue(matcher.contains_any("I want to KmS"))
+        self.assertFalse(matcher.contains_any("I am fine"))
+
+    def test_empty_words_are_ignored(self):
+        """An empty trigger word must not flag every text"""
+        matcher = TriggerWordMatcher([("", "none"), ("kms", "self-harm")])
+        self.assertEqual(len(matcher), 1)
+        self.assertFalse(matcher.contains_any("hello"))
+
+    @override_settings(MODERATION_CATEGORY_THRESHOLDS={"profanity": 2})
+    def test_scan_scores_each_category(self):
+        """Matches are grouped by category and compared to thresholds"""
+        matcher = TriggerWordMatcher(
+            [("kms", "self-harm"), ("darn", "profanity")]
+        )
+        result = matcher.scan("darn, kms")
+        self.assertTrue(result["flagged"])
+        self.assertEqual(
+            result["matches"],
+            [
+                {
+                    "word": "darn",
+                    "category": "profanity",
+                    "start": 0,
+                    "end": 4,
+                },
+                {"word": "kms", "category": "self-harm", "start": 6, "end": 9},
+            ],
+        )
+        self.assertEqual(
+            result["categories"]["profanity"],
+            {"count": 1, "threshold": 2, "flagged": False},
+        )
+        self.assertTrue(result["categories"]["self-harm"]["flagged"])
+
+    @override_settings(MODERATION_CATEGORY_THRESHOLDS={"profanity": 2})
+    def test_scan_below_threshold_is_not_flagged(self):
+        """Matches that stay under their threshold do not flag the text"""
+        matcher = TriggerWordMatcher([("darn", "profanity")])
+        result = matcher.scan("darn it")
+        self.assertFalse(result["flagged"])
+        self.assertEqual(len(result["matches"]), 1)
+
+
+class NormalizedMatchingTest(SimpleTestCase):
+    def setUp(self):
+        self.matcher = TriggerWordMatcher(
+            [
+                ("kms", "self-harm", True),
+                ("kill myself", "self-harm", True),
+                ("cut", "self-harm", False),
+            ]
+        )
+
+    def words(self, text):
+        return [match.word for match in self.matcher.iter_matches(text)]
+
+    def test_obfuscated_words_are_matched(self):
+        """Full-width, zero-width, homoglyph and leetspeak forms match"""
+        self.assertEqual(self.words("ｋｍｓ"), ["kms"])
+        self.assertEqual(self.words("k\u200dm\u200bs"), ["kms"])
+        self.assertEqual(self.words("\u043ams"), ["kms"])  # Cyrillic k
+        self.assertEqual(self.words("KM5"), ["kms"])
+        self.assertEqual(self.words("k\u0336m\u0336s\u0336"), ["kms"])
+        self.assertEqual(self.words("k1ll   mys3lf"), ["kill myself"])
+
+    def test_whole_words_respect_boundaries(self):
+        """Whole-word entries do not match inside longer words"""
+        self.assertEqual(self.words("the bookmkms list"), [])
+        self.assertEqual(self.words("kmsx"), [])
+        self.assertEqual(self.words("(kms)"), ["kms"])
+        self.assertEqual(self.words("haircut"), ["cut"])
+
+    def test_offsets_point_into_the_original_text(self):
+        """Match offsets survive characters that are stripped or folded"""
+        text = "so \u200bｋｍｓ!"
+        match = next(self.matcher.iter_matches(text))
+        self.assertEqual(text[match.start : match.end], "ｋｍｓ")
+
+
+class CheckContentTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+        TriggerWord.objects.create(word="kms", category="self-harm")
+
+    def test_check_flags_trigger_words(self):
+        """Content containing a trigger word is flagged"""
+        response = self.client.post(
+            reverse("flaggedcontent-check-content"),
+            {"content": "I think kms is the answer"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["flagged"])
+        self.assertEqual(
+            response.data["matches"],
+            [{"word": "kms", "category": "self-harm", "start": 8, "end": 11}],
+        )
+
+    def test_check_safe_content(self):
+        """Content without trigger words is not flagged"""
+        response = self.client.post(
+            reverse("triggerword-check-content"),
+            {"content": "Having a great day"},
+            format="json",
+        )
+        self.assertFalse(response.data["flagged"])
+
+    def test_check_rejects_non_string_content(self):
+        """Numbers and lists are a 400, like the async check"""
+        for name in (
+            "flaggedcontent-check-content",
+            "triggerword-check-content",
+        ):
+            for content in (42, ["kms"], {"text": "kms"}):
+                response = self.client.post(
+                    reverse(name), {"content": content}, format="json"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertEqual(
+                    response.data, {"error": "'content' must be a string."}
+                )
+
+    def test_check_rejects_non_object_bodies(self):
+        """A JSON array body is a 400 on every check endpoint"""
+        for name in (
+            "flaggedcontent-check-content",
+            "triggerword-check-content",
+            "flaggedcontent-check-batch",
+        ):
+            with self.subTest(name):
+                response = self.client.post(
+                    reverse(name), ["kms"], format="json"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertEqual(
+                    response.data,
+                    {"error": "Request body must be a JSON object."},
+                )
+
+    def test_check_sees_new_trigger_words(self):
+        """Words added after the first check are matched"""
+        url = reverse("flaggedcontent-check-content")
+        self.client.post(url, {"content": "hello"}, format="json")
+        TriggerWord.objects.create(word="hopeless", category="self-harm")
+        response = self.client.post(
+            url, {"content": "I feel hopeless"}, format="json"
+        )
+        self.assertTrue(response.data["flagged"])
+
+    def test_check_batch_returns_per_item_results(self):
+        """Each batch item gets its own result, keyed by its id"""
+        response = self.client.post(
+            reverse("flaggedcontent-check-batch"),
+            {
+                "items": [
+                    {"id": "post-1", "content": "kms"},
+                    {"id": "post-2", "content": "Having a great day"},
+                    {"id": "post-3"},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": "post-1",
+                    "flagged": True,
+                    "matches": [
+                        {
+                            "word": "kms",
+                            "category": "self-harm",
+                            "start": 0,
+                            "end": 3,
+                        }
+                    ],
+                    "categories": {
+                        "self-harm": {
+                            "count": 1,
+                            "threshold": 1,
+                            "flagged": True,
+                        }
+                    },
+                },
+                {
+                    "id": "post-2",
+                    "flagged": False,
+                    "matches": [],
+                    "categories": {},
+                },
+                {"id": "post-3", "error": "'content' must be a string."},
+            ],
+        )
+
+    @override_settings(MODERATION_CHECK_BATCH_MAX_ITEMS=2)
+    def test_check_batch_item_limit(self):
+        """Batches over the configured item limit are rejected"""
+        response = self.client.post(
+            reverse("flaggedcontent-check-batch"),
+            {"items": [{"id": i, "content": "x"} for i in range(3)]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MODERATION_CHECK_BATCH_MAX_BYTES=10)
+    def test_check_batch_size_limit(self):
+        """Batches over the configured content size are rejected"""
+        response = self.client.post(
+            reverse("flaggedcontent-check-batch"),
+            {"items": [{"id": 1, "content": "x" * 11}]},
+            format="json",
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+
+class TriggerWordCacheTest(TestCase):
+    def test_version_bumps_on_every_change(self):
+        """Creating, updating and deleting a word each bump the version"""
+        start = versions.get_version(versions.TRIGGER_WORDS)
+        word = TriggerWord.objects.create(word="kms", category="self-harm")
+        word.category = "crisis"
+        word.save()
+        word.delete()
+        self.assertEqual(
+            versions.get_version(versions.TRIGGER_WORDS), start + 3
+        )
+
+    def test_cached_matcher_skips_the_database(self):
+        """Repeat lookups within the TTL do not query the database"""
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        matcher = get_matcher()
+        with self.assertNumQueries(0):
+            self.assertIs(get_matcher(), matcher)
+
+    @override_settings(MODERATION_MATCHER_VERSION_TTL=0)
+    def test_rebuilds_when_another_worker_bumps_the_version(self):
+        """A version bump made elsewhere triggers a lazy rebuild"""
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        matcher = get_matcher()
+        # Simulate another worker's edit, which skips our signal handler
+        TriggerWord.objects.filter(word="kms").update(word="hopeless")
+        versions.bump_version(versions.TRIGGER_WORDS)
+        rebuilt = get_matcher()
+        self.assertIsNot(rebuilt, matcher)
+        self.assertTrue(rebuilt.contains_any("I feel hopeless"))
+
+
+class MatcherSnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "matcher.bin")
+        self.addCleanup(invalidate_matcher)
+
+    def test_snapshot_matches_like_the_compiled_matcher(self):
+        """A mapped snapshot finds what the matcher it came from finds"""
+        matcher = TriggerWordMatcher(
+            [
+                ("he", "test", False),
+                ("she", "test", False),
+                ("hers", "tëst", False),
+                ("kms", "self-harm", True),
+                ("kill myself", "self-harm", True),
+            ]
+        )
+        write_snapshot(self.path, matcher, 7)
+        snapshot = open_snapshot(self.path, 7)
+
+        self.assertIsInstance(snapshot, SnapshotMatcher)
+        self.assertEqual(snapshot.version, 7)
+        self.assertEqual(len(snapshot), 5)
+        for text in ["ushers", "so \u200bｋｍｓ!", "kmsx", "k1ll   mys3lf"]:
+            self.assertEqual(
+                list(snapshot.iter_matches(text)),
+                list(matcher.iter_matches(text)),
+            )
+
+    def test_stale_or_damaged_snapshots_are_ignored(self):
+        """Only a complete snapshot for the current version is mapped"""
+        self.assertIsNone(open_snapshot(self.path, 1))
+        write_snapshot(self.path, TriggerWordMatcher([("kms", "x")]), 2)
+        self.assertIsNone(open_snapshot(self.path, 1))
+        # Never replaced by an older version
+        self.assertFalse(write_snapshot(self.path, TriggerWordMatcher([]), 1))
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertLogs("moderation.snapshot", "ERROR"):
+            self.assertIsNone(open_snapshot(self.path, 2))
+
+    @override_settings(MODERATION_MATCHER_VERSION_TTL=0)
+    def test_workers_share_and_swap_the_snapshot(self):
+        """get_matcher publishes a snapshot and maps the next version"""
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        with self.settings(MODERATION_MATCHER_SNAPSHOT_PATH=self.path):
+            matcher = get_matcher()
+            self.assertIsInstance(matcher, SnapshotMatcher)
+            self.assertTrue(matcher.contains_any("kms"))
+
+            # Another worker edits the words and publishes the snapshot
+            TriggerWord.objects.filter(word="kms").update(word="hopeless")
+            versions.bump_version(versions.TRIGGER_WORDS)
+            call_command(
+                "build_matcher_snapshot", path=self.path, stdout=io.StringIO()
+            )
+            with patch("moderation.matcher.build_matcher") as build:
+                swapped = get_matcher()
+            build.assert_not_called()
+            self.assertTrue(swapped.contains_any("I feel hopeless"))
+            # The old mapping keeps working after the file is replaced
+            self.assertTrue(matcher.contains_any("kms"))
+
+
+class BulkFlaggedContentTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+
+    def item(self, **overrides):
+        item = {
+            "content": "Test post containing kms",
+            "user": "testfirebaseuid",
+            "post_id": "12345",
+            "reason": "Trigger words detected",
+        }
+        item.update(overrides)
+        return item
+
+    def test_bulk_create_inserts_all_items(self):
+        """Valid items are written together in one request"""
+        items = [self.item(post_id=str(i)) for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("flaggedcontent-bulk-create"),
+                {"items": items},
+                format="json",
+            )
+        inserts = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "moderation_flagged')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data, {"created": 20, "duplicates": 0, "errors": []}
+        )
+        self.assertEqual(FlaggedContent.objects.count(), 20)
+
+    def test_bulk_create_reports_invalid_items(self):
+        """Invalid items are reported by index and the rest are saved"""
+        items = [
+            self.item(),
+            self.item(parent_type="comment"),
+            self.item(parent_type="thread"),
+            self.item(post_id="x" * 101),
+        ]
+        response = self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            {"items": items},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(
+            response.data["errors"][:2],
+            [
+                {
+                    "index": 1,
+                    "error": "'comment_id' is a required field for comment.",
+                },
+                {"index": 2, "error": "Invalid parent_type specified."},
+            ],
+        )
+        self.assertEqual(response.data["errors"][2]["index"], 3)
+        self.assertEqual(FlaggedContent.objects.count(), 1)
+
+    def test_bulk_create_counts_duplicates(self):
+        """Repeats in and across batches bump the existing row's count"""
+        FlaggedContent.objects.create(**self.item())
+        items = [self.item(), self.item(), self.item(post_id="2")]
+        response = self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            {"items": items},
+            format="json",
+        )
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["duplicates"], 2)
+        self.assertEqual(
+            FlaggedContent.objects.get(post_id="12345").report_count, 3
+        )
+
+    def test_repeat_reports_are_counted(self):
+        """Reporting the same content twice keeps a single row"""
+        url = reverse("flaggedcontent-list")
+        first = self.client.post(url, self.item(), format="json")
+        second = self.client.post(url, self.item(), format="json")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertTrue(second.data["duplicate"])
+        self.assertEqual(second.data["id"], first.data["id"])
+        self.assertEqual(FlaggedContent.objects.count(), 1)
+        self.assertEqual(FlaggedContent.objects.get().report_count, 2)
+
+    def test_different_reasons_are_separate_reports(self):
+        """The dedup key includes the reason"""
+        url = reverse("flaggedcontent-list")
+        self.client.post(url, self.item(), format="json")
+        self.client.post(url, self.item(reason="Spam"), format="json")
+        self.assertEqual(FlaggedContent.objects.count(), 2)
+
+    def test_idempotency_key_replays_the_first_result(self):
+        """A retried request with the same key is not counted again"""
+        url = reverse("flaggedcontent-list")
+        for _ in range(3):
+            response = self.client.post(
+                url,
+                self.item(),
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="retry-1",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(FlaggedContent.objects.get().report_count, 1)
+
+        self.client.post(
+            url, self.item(), format="json", HTTP_IDEMPOTENCY_KEY="retry-2"
+        )
+        self.assertEqual(FlaggedContent.objects.get().report_count, 2)
+
+    def test_repeat_reports_reopen_reviewed_content(self):
+        """Reviewed content reported again goes back in the queue"""
+        url = reverse("flaggedcontent-list")
+        for post_id in ("12345", "2"):
+            self.client.post(url, self.item(post_id=post_id), format="json")
+        update_counted(
+            FlaggedContent.objects.all(), reviewed=True, is_visible=True
+        )
+        FirestoreOutbox.objects.all().delete()
+
+        self.client.post(url, self.item(), format="json")
+        self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            {"items": [self.item(post_id="2")]},
+            format="json",
+        )
+
+        self.assertFalse(FlaggedContent.objects.filter(reviewed=True).exists())
+        self.assertEqual(
+            sorted(
+                FirestoreOutbox.objects.values_list("document_path", "data")
+            ),
+            [
+                ("Posts/12345", {"reviewed": False}),
+                ("Posts/2", {"reviewed": False}),
+            ],
+        )
+        self.assertEqual(queue_stats(1)["reviewed"], {"true": 0, "false": 2})
+
+    def test_reviews_keep_concurrent_repeat_reports(self):
+        """A repeat report between fetch and save is not overwritten"""
+        response = self.client.post(
+            reverse("flaggedcontent-list"), self.item(), format="json"
+        )
+        pk = response.data["id"]
+        update_counted(FlaggedContent.objects.filter(pk=pk), reviewed=True)
+
+        def repeat_report_then_save(serializer):
+            # The view has already fetched the reviewed row
+            record_report(build_flagged_content(self.item()))
+            return save_review(serializer)
+
+        with patch(
+            "moderation.views.save_review", side_effect=repeat_report_then_save
+        ):
+            response = self.client.patch(
+                reverse("flaggedcontent-detail", args=[pk]),
+                {"is_visible": False},
+                format="json",
+            )
+
+        self.assertEqual(response.data["report_count"], 2)
+        flagged = FlaggedContent.objects.get(pk=pk)
+        self.assertEqual(flagged.report_count, 2)
+        self.assertFalse(flagged.reviewed)
+        self.assertFalse(flagged.is_visible)
+        self.assertEqual(queue_stats(1)["reviewed"], {"false": 1, "true": 0})
+
+    def test_idempotency_keys_expire(self):
+        """Expired keys count as new requests and can be pruned"""
+        url = reverse("flaggedcontent-list")
+        self.client.post(
+            url, self.item(), format="json", HTTP_IDEMPOTENCY_KEY="retry-1"
+        )
+        FlagIdempotencyKey.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=2)
+        )
+        self.client.post(
+            url, self.item(), format="json", HTTP_IDEMPOTENCY_KEY="retry-1"
+        )
+        self.assertEqual(FlaggedContent.objects.get().report_count, 2)
+        self.assertEqual(FlagIdempotencyKey.objects.count(), 1)
+
+        FlagIdempotencyKey.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=2)
+        )
+        output = io.StringIO()
+        call_command("prune_idempotency_keys", stdout=output)
+        self.assertEqual(output.getvalue().strip(), "Deleted 1 key(s).")
+        self.assertFalse(FlagIdempotencyKey.objects.exists())
+
+    @override_settings(MODERATION_BULK_CREATE_MAX_ITEMS=1)
+    def test_bulk_create_item_limit(self):
+        """Requests over the configured item limit are rejected"""
+        response = self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            {"items": [self.item(), self.item()]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(FlaggedContent.objects.count(), 0)
+
+    def test_bulk_create_rejects_non_object_bodies(self):
+        """A bare JSON array is a 400, not a server error"""
+        response = self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            [self.item()],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {"error": "Request body must be a JSON object."}
+        )
+        self.assertEqual(FlaggedContent.objects.count(), 0)
+
+
+class FlaggedContentListTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+
+        for i in range(5):
+            FlaggedContent.objects.create(
+                user=f"user{i % 2}",
+                post_id=str(i),
+                reason="Spam" if i == 4 else "Trigger words detected",
+                content=f"Post {i}",
+                reviewed=i < 2,
+            )
+
+    def post_ids(self, response):
+        return [item["post_id"] for item in response.data["results"]]
+
+    def test_list_is_paginated_with_a_cursor(self):
+        """Pages follow (flagged_at, id) order through the next links"""
+        url = reverse("flaggedcontent-list")
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(self.post_ids(response), ["0", "1"])
+        self.assertIsNone(response.data["previous"])
+
+        seen = self.post_ids(response)
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += self.post_ids(response)
+        self.assertEqual(seen, ["0", "1", "2", "3", "4"])
+
+    def test_list_filters(self):
+        """Listings can be filtered by status, reason and user"""
+        url = reverse("flaggedcontent-list")
+        response = self.client.get(url, {"reviewed": "false"})
+        self.assertEqual(self.post_ids(response), ["2", "3", "4"])
+        response = self.client.get(url, {"reason": "Spam"})
+        self.assertEqual(self.post_ids(response), ["4"])
+        response = self.client.get(url, {"user": "user1", "reviewed": "0"})
+        self.assertEqual(self.post_ids(response), ["3"])
+
+    def test_list_date_range(self):
+        """flagged_after and flagged_before bound flagged_at"""
+        FlaggedContent.objects.filter(post_id="0").update(
+            flagged_at="2024-01-01T00:00:00Z"
+        )
+        url = reverse("flaggedcontent-list")
+        response = self.client.get(url, {"flagged_before": "2024-06-01"})
+        self.assertEqual(self.post_ids(response), ["0"])
+        response = self.client.get(url, {"flagged_after": "2024-06-01"})
+        self.assertEqual(self.post_ids(response), ["1", "2", "3", "4"])
+
+    def test_list_rejects_bad_filters(self):
+        """Malformed filter values are a 400, not an empty page"""
+        url = reverse("flaggedcontent-list")
+        response = self.client.get(url, {"reviewed": "maybe"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for value in ("yesterday", "2024-02-30", "2024-02-10T25:00"):
+            for url in (
+                reverse("flaggedcontent-list"),
+                reverse("flaggedcontent-export"),
+            ):
+                with self.subTest(value=value, url=url):
+                    response = self.client.get(url, {"flagged_after": value})
+                    self.assertEqual(
+                        response.status_code, status.HTTP_400_BAD_REQUEST
+                    )
+
+    def test_export_streams_ndjson(self):
+        """The NDJSON export has one filtered record per line"""
+        response = self.client.get(
+            reverse("flaggedcontent-export"), {"reviewed": "false"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["post_id"] for row in rows], ["2", "3", "4"])
+        self.assertEqual(
+            set(rows[0]), set(FlaggedContentSerializer.Meta.fields)
+        )
+
+    def test_export_streams_csv(self):
+        """The CSV export starts with a header row"""
+        response = self.client.get(
+            reverse("flaggedcontent-export"),
+            {"export_format": "csv", "reason": "Spam"},
+        )
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], FlaggedContentSerializer.Meta.fields)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][rows[0].index("content")], "Post 4")
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        """ASGI exports are sent chunk by chunk, not buffered whole"""
+
+        async def export():
+            response = await self.async_client.get(
+                reverse("flaggedcontent-export"),
+                headers={"Authorization": "Bearer mocked.token"},
+            )
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response])
+
+        with self.settings(MODERATION_EXPORT_CHUNK_SIZE=2):
+            content = await export()
+        self.assertEqual(
+            len(content.decode().splitlines()),
+            await FlaggedContent.objects.acount(),
+        )
+
+    def test_export_negotiates_its_media_types(self):
+        """Accept headers naming an export format are not refused"""
+        url = reverse("flaggedcontent-export")
+        response = self.client.get(url, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), FlaggedContent.objects.count())
+
+        response = self.client.get(url, HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        response = self.client.get(
+            url, {"export_format": "xml"}, HTTP_ACCEPT="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", json.loads(response.content))
+
+    def test_export_rejects_unknown_formats(self):
+        """Only NDJSON and CSV can be exported"""
+        response = self.client.get(
+            reverse("flaggedcontent-export"), {"export_format": "xml"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FlaggedContentIndexTest(TestCase):
+    def test_unreviewed_queue_uses_partial_index(self):
+        """The oldest-first queue of unreviewed items reads the index"""
+        plan = (
+            FlaggedContent.objects.filter(reviewed=False)
+            .order_by("flagged_at", "id")
+            .explain()
+        )
+        self.assertIn("flagged_unreviewed_idx", plan)
+
+    def test_parent_lookup_uses_parent_index(self):
+        """Looking up the flags for a comment reads the parent index"""
+        plan = FlaggedContent.objects.filter(
+            post_id="12345", comment_id="c1", reply_id=None
+        ).explain()
+        self.assertIn("flagged_parent_idx", plan)
+
+    def test_filtered_listing_uses_an_index(self):
+        """A user's flags in pagination order come from the user index"""
+        plan = (
+            FlaggedContent.objects.filter(user="testfirebaseuid")
+            .order_by("flagged_at", "id")
+            .explain()
+        )
+        self.assertIn("flagged_user_idx", plan)
+
+
+def use_mock_firebase(testcase):
+    # Accept every Firebase ID token as the "testfirebaseuid" user for one
+    # test, and authenticate the test's API client with a dummy token
+    patcher = patch("firebase_admin.auth.verify_id_token")
+    mock_firebase = patcher.start()
+    testcase.addCleanup(patcher.stop)
+    mock_firebase.return_value = {"uid": "testfirebaseuid"}
+    token_cache.clear()
+    if isinstance(testcase, APITestCase):
+        testcase.client.credentials(HTTP_AUTHORIZATION="Bearer mocked.token")
+    return mock_firebase
+
+
+def use_in_memory_firestore(testcase, **options):
+    # Swap in a fresh in-memory Firestore gateway for one test
+    override = override_settings(
+        MODERATION_FIRESTORE_GATEWAY=(
+            "moderation.firestore.InMemoryFirestoreGateway"
+        ),
+        MODERATION_FIRESTORE_GATEWAY_OPTIONS=options,
+    )
+    override.enable()
+    testcase.addCleanup(override.disable)
+    return get_gateway()
+
+
+class ApproveFlaggedContentTest(TestCase):
+    def setUp(self):
+        self.gateway = use_in_memory_firestore(self, strict=True)
+        self.request = RequestFactory().post("/admin/")
+        self.request.session = {}
+        self.request._messages = FallbackStorage(self.request)
+        self.modeladmin = FlaggedContentAdmin(FlaggedContent, AdminSite())
+
+    def flag(self, post_id, comment_id=None, reply_id=None, reason="Spam"):
+        flagged = FlaggedContent.objects.create(
+            user="testfirebaseuid",
+            post_id=post_id,
+            comment_id=comment_id,
+            reply_id=reply_id,
+            reason=reason,
+            content="Flagged text",
+        )
+        path = document_path(post_id, comment_id, reply_id)
+        self.gateway.documents[path] = {"is_visible": False}
+        return flagged
+
+    def test_document_paths(self):
+        """Posts, comments and replies resolve to their own documents"""
+        self.assertEqual(document_path("p1"), "Posts/p1")
+        self.assertEqual(document_path("p1", "c1"), "Posts/p1/Comments/c1")
+        self.assertEqual(
+            document_path("p1", "c1", "r1"),
+            "Posts/p1/Comments/c1/Replies/r1",
+        )
+
+    def test_approve_queues_batched_firestore_writes(self):
+        """Approving many rows queues one update per document"""
+        for i in range(MAX_BATCH_WRITES + 10):
+            self.flag(f"p{i}")
+        self.flag("p0", "c1")
+        self.flag("p0", "c1", "r1")
+        self.flag("p0", "c1", "r1", reason="Trigger words detected")
+
+        approve_flagged_content(
+            self.modeladmin, self.request, FlaggedContent.objects.all()
+        )
+        self.assertFalse(
+            FlaggedContent.objects.filter(is_visible=False).exists()
+        )
+        self.assertEqual(self.gateway.round_trips, 0)
+        self.assertEqual(
+            FirestoreOutbox.objects.count(), MAX_BATCH_WRITES + 12
+        )
+
+        while drain_outbox(self.gateway):
+            pass
+        self.assertEqual(self.gateway.round_trips, 2)
+        self.assertEqual(self.gateway.writes, MAX_BATCH_WRITES + 12)
+        self.assertEqual(
+            self.gateway.documents["Posts/p0/Comments/c1/Replies/r1"],
+            {"is_visible": True, "reviewed": True},
+        )
+
+    def test_approval_lands_after_queued_updates(self):
+        """An update queued before the approval cannot overwrite it"""
+        self.flag("p1")
+        enqueue_update("Posts/p1", {"is_visible": False, "reviewed": True})
+
+        approve_flagged_content(
+            self.modeladmin, self.request, FlaggedContent.objects.all()
+        )
+        drain_outbox(self.gateway)
+
+        self.assertEqual(
+            self.gateway.documents["Posts/p1"],
+            {"is_visible": True, "reviewed": True},
+        )
+        self.assertTrue(FlaggedContent.objects.get(post_id="p1").is_visible)
+
+
+class FirestoreOutboxTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+
+        self.flagged = FlaggedContent.objects.create(
+            user="testfirebaseuid",
+            post_id="p1",
+            comment_id="c1",
+            reason="Spam",
+            content="Flagged text",
+        )
+        self.gateway = use_in_memory_firestore(self)
+
+    def update(self, **data):
+        return self.client.patch(
+            reverse("flaggedcontent-detail", args=[self.flagged.id]),
+            data,
+            format="json",
+        )
+
+    def test_update_queues_firestore_write(self):
+        """Updates commit locally and queue the Firestore write"""
+        response = self.update(reviewed=True, is_visible=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.gateway.round_trips, 0)
+
+        queued = FirestoreOutbox.objects.get()
+        self.assertEqual(queued.document_path, "Posts/p1/Comments/c1")
+        self.assertEqual(queued.data, {"is_visible": True, "reviewed": True})
+
+    def test_drain_collapses_updates_per_document(self):
+        """Several queued updates to a document become one write"""
+        self.update(reviewed=True)
+        self.update(is_visible=True)
+        self.update(is_visible=False)
+
+        self.assertEqual(drain_outbox(self.gateway), 3)
+
+        self.assertEqual(self.gateway.writes, 1)
+        self.assertEqual(
+            self.gateway.documents["Posts/p1/Comments/c1"],
+            {"is_visible": False, "reviewed": True},
+        )
+        self.assertFalse(FirestoreOutbox.objects.exists())
+
+    def test_failed_writes_back_off(self):
+        """Failed writes are kept and retried with growing delays"""
+        self.update(reviewed=True)
+        self.gateway.error_rate = 1
+
+        drain_outbox(self.gateway)
+        queued = FirestoreOutbox.objects.get()
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(queued.last_error, "Injected Firestore error")
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing is sent
+        self.assertEqual(drain_outbox(self.gateway), 0)
+        self.assertLess(retry_delay(1), retry_delay(2))
+
+    @override_settings(MODERATION_OUTBOX_MAX_ATTEMPTS=1)
+    def test_exhausted_writes_are_marked_failed(self):
+        """Rows that use up their retries stop being picked up"""
+        self.update(reviewed=True)
+        self.gateway.error_rate = 1
+
+        drain_outbox(self.gateway)
+        self.assertTrue(FirestoreOutbox.objects.get().failed)
+
+    def test_sync_firestore_command(self):
+        """The worker command drains the outbox and exits with --once"""
+        self.update(reviewed=True)
+        call_command("sync_firestore", "--once", stdout=io.StringIO())
+        self.assertFalse(FirestoreOutbox.objects.exists())
+        self.assertEqual(self.gateway.writes, 1)
+
+    def test_firestore_is_called_outside_a_transaction(self):
+        """Rows are leased and settled in transactions of their own"""
+        self.update(reviewed=True)
+        depth = len(connection.atomic_blocks)
+        depths = []
+        batch_update = self.gateway.batch_update
+
+        def record_depth(updates):
+            depths.append(len(connection.atomic_blocks))
+            leased = FirestoreOutbox.objects.get()
+            self.assertGreater(leased.leased_until, timezone.now())
+            return batch_update(updates)
+
+        with patch.object(self.gateway, "batch_update", record_depth):
+            self.assertEqual(drain_outbox(self.gateway), 1)
+        self.assertEqual(depths, [depth])
+        self.assertFalse(FirestoreOutbox.objects.exists())
+
+    def test_leased_documents_are_skipped(self):
+        """A document with a write in flight waits for its lease"""
+        self.update(reviewed=True)
+        FirestoreOutbox.objects.update(
+            leased_until=timezone.now() + datetime.timedelta(minutes=1)
+        )
+        self.update(is_visible=True)
+        self.assertEqual(drain_outbox(self.gateway), 0)
+
+        # An expired lease is taken over, merging both updates
+        FirestoreOutbox.objects.update(leased_until=timezone.now())
+        self.assertEqual(drain_outbox(self.gateway), 2)
         self.assertEqual(
-            response.data[0].get("content", ""), "Test post containing kms"
+            self.gateway.documents["Posts/p1/Comments/c1"],
+            {"is_visible": True, "reviewed": True},
         )
+
+    def test_sync_firestore_command_backs_off_on_errors(self):
+        """Database errors are logged and retried, not fatal"""
+        command = "moderation.management.commands.sync_firestore"
+        # The second sleep is the idle poll, which ends the loop
+        with patch(
+            f"{command}.drain_outbox",
+            side_effect=[OperationalError("database is locked"), 1, 0],
+        ), patch(
+            f"{command}.time.sleep", side_effect=[None, KeyboardInterrupt]
+        ) as sleep, self.assertLogs(
+            command, "ERROR"
+        ), self.assertRaises(
+            KeyboardInterrupt
+        ):
+            call_command("sync_firestore", stdout=io.StringIO())
+        self.assertEqual(
+            sleep.call_args_list[0].args, (retry_delay(1).total_seconds(),)
+        )
+
+    def test_sync_firestore_once_exits_on_errors(self):
+        """A one-off run fails instead of retrying forever"""
+        command = "moderation.management.commands.sync_firestore"
+        with patch(
+            f"{command}.drain_outbox",
+            side_effect=OperationalError("database is locked"),
+        ), patch(f"{command}.time.sleep") as sleep, self.assertRaisesMessage(
+            CommandError, "database is locked"
+        ):
+            call_command("sync_firestore", "--once", stdout=io.StringIO())
+        sleep.assert_not_called()
+
+
+class InMemoryFirestoreGatewayTest(SimpleTestCase):
+    def test_latency_and_errors_are_injected(self):
+        """Each round-trip sleeps and fails at the configured rate"""
+        gateway = InMemoryFirestoreGateway(latency=0.01, error_rate=1)
+        started = time.monotonic()
+        with self.assertRaises(FirestoreUnavailable):
+            gateway.update("Posts/p1", {"is_visible": True})
+        self.assertGreaterEqual(time.monotonic() - started, 0.01)
+
+    def test_async_updates(self):
+        """update_async writes without blocking the event loop"""
+        gateway = InMemoryFirestoreGateway(latency=0.01)
+
+        async def update_many():
+            await asyncio.gather(
+                *(
+                    gateway.update_async(f"Posts/p{i}", {"reviewed": True})
+                    for i in range(20)
+                )
+            )
+
+        started = time.monotonic()
+        asyncio.run(update_many())
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(len(gateway.documents), 20)
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        self.mock_firebase = use_mock_firebase(self)
+        self.factory = RequestFactory()
+
+    def authenticate(self, token="mocked.token"):
+        request = self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return FirebaseAuthentication().authenticate(request)
+
+    def test_repeat_tokens_skip_verification(self):
+        """A verified token is served from the cache without a DB lookup"""
+        user, _ = self.authenticate()
+        with self.assertNumQueries(0):
+            cached_user, _ = self.authenticate()
+
+        self.assertEqual(cached_user, user)
+        self.assertEqual(self.mock_firebase.call_count, 1)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+        self.assertEqual(token_cache.stats()["misses"], 1)
+
+    def test_entries_expire_with_the_token(self):
+        """A cached token is verified again once its exp has passed"""
+        self.mock_firebase.return_value = {
+            "uid": "testfirebaseuid",
+            "exp": time.time() - 1,
+        }
+        self.authenticate()
+        self.authenticate()
+        self.assertEqual(self.mock_firebase.call_count, 2)
+
+    @override_settings(FIREBASE_TOKEN_CACHE_TTL=0)
+    def test_ttl_bounds_entries(self):
+        """Entries older than FIREBASE_TOKEN_CACHE_TTL are not reused"""
+        self.authenticate()
+        self.authenticate()
+        self.assertEqual(self.mock_firebase.call_count, 2)
+
+    @override_settings(FIREBASE_TOKEN_CACHE_SIZE=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        """The cache never holds more than FIREBASE_TOKEN_CACHE_SIZE tokens"""
+        for token in ("a", "b", "a", "c"):
+            self.authenticate(token)
+
+        self.assertEqual(token_cache.stats()["size"], 2)
+        self.authenticate("a")
+        self.authenticate("b")
+        self.assertEqual(self.mock_firebase.call_count, 4)
+
+    def test_invalid_tokens_are_not_cached(self):
+        """Tokens that fail verification are checked every time"""
+        self.mock_firebase.side_effect = ValueError("bad token")
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                self.authenticate()
+        self.assertEqual(self.mock_firebase.call_count, 2)
+        self.assertEqual(token_cache.stats()["size"], 0)
+
+
+def make_signing_key():
+    # RSA key and the self-signed PEM certificate a key store serves for it
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    pem = certificate.public_bytes(serialization.Encoding.PEM).decode()
+    return key, pem
+
+
+class PublicKeyStoreTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key, cls.pem = make_signing_key()
+
+    def setUp(self):
+        token_cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.keys_file = os.path.join(directory.name, "keys.json")
+        self.write_keys({"key-1": self.pem})
+        self.store = PublicKeyStore(self.keys_file, "test-project")
+        self.store.load()
+
+    def write_keys(self, keys):
+        with open(self.keys_file, "w") as f:
+            json.dump(keys, f)
+
+    def make_token(self, kid="key-1", key=None, **claims):
+        now = int(time.time())
+        payload = {
+            "aud": "test-project",
+            "iss": "https://securetoken.google.com/test-project",
+            "sub": "testfirebaseuid",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        payload.update(claims)
+        return jwt.encode(
+            payload, key or self.key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    def test_verifies_tokens_locally(self):
+        """Tokens signed with a loaded key verify without a fetch"""
+        with patch("requests.get") as get:
+            claims = self.store.verify(self.make_token())
+        get.assert_not_called()
+        self.assertEqual(claims["uid"], "testfirebaseuid")
+
+    def test_rejects_wrong_project_and_expired_tokens(self):
+        """Audience, issuer and expiry are checked"""
+        for claims in (
+            {"aud": "other-project"},
+            {"iss": "https://securetoken.google.com/other-project"},
+            {"exp": int(time.time()) - 10},
+            {"sub": ""},
+        ):
+            with self.assertRaises(jwt.InvalidTokenError):
+                self.store.verify(self.make_token(**claims))
+
+    def test_rejects_tokens_signed_with_another_key(self):
+        """A valid-looking token signed by an unknown key fails"""
+        other_key, _ = make_signing_key()
+        with self.assertRaises(jwt.InvalidSignatureError):
+            self.store.verify(self.make_token(key=other_key))
+
+    def test_unknown_kid_fails_fast_and_schedules_reload(self):
+        """An unknown key id is rejected at once and reloaded in background"""
+        other_key, other_pem = make_signing_key()
+        self.write_keys({"key-1": self.pem, "key-2": other_pem})
+        self.store._attempted_at = None
+
+        with patch.object(self.store, "start") as start:
+            with self.assertRaises(jwt.InvalidKeyError):
+                self.store.verify(self.make_token("key-2", other_key))
+        start.assert_called_once()
+        self.assertTrue(self.store._wake.is_set())
+
+        self.store.load()
+        claims = self.store.verify(self.make_token("key-2", other_key))
+        self.assertEqual(claims["uid"], "testfirebaseuid")
+
+    def test_loads_keys_over_http(self):
+        """Keys can be served by a local HTTP stub, honouring max-age"""
+        body = json.dumps({"key-1": self.pem}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", "public, max-age=600")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        store = PublicKeyStore(
+            f"http://127.0.0.1:{server.server_port}/", "test-project"
+        )
+        store.load()
+        self.assertAlmostEqual(
+            store._refresh_at - time.monotonic(), 300, delta=5
+        )
+        self.assertEqual(
+            store.verify(self.make_token())["uid"], "testfirebaseuid"
+        )
+
+    def test_short_lifetimes_do_not_refresh_in_a_loop(self):
+        """max-age=0 still waits MIN_RELOAD_INTERVAL before refreshing"""
+        for lifetime in (0, 1):
+            with patch.object(
+                self.store, "_fetch", return_value=({}, lifetime)
+            ):
+                self.store.load()
+            self.assertAlmostEqual(
+                self.store._refresh_at - time.monotonic(),
+                MIN_RELOAD_INTERVAL,
+                delta=5,
+            )
+
+    def test_authentication_uses_the_key_store(self):
+        """FIREBASE_LOCAL_VERIFICATION verifies without firebase_admin"""
+        request = RequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {self.make_token()}"
+        )
+        with override_settings(
+            FIREBASE_LOCAL_VERIFICATION=True,
+            FIREBASE_PUBLIC_KEYS_SOURCE=self.keys_file,
+            FIREBASE_PROJECT_ID="test-project",
+        ), patch("firebase_admin.auth.verify_id_token") as verify, patch(
+            "moderation.keystore.PublicKeyStore.start"
+        ):
+            warm_up()
+            user, _ = FirebaseAuthentication().authenticate(request)
+
+        verify.assert_not_called()
+        self.assertEqual(user.username, "testfirebaseuid")
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+
+        self.headers = {"Authorization": "Bearer mocked.token"}
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        self.flagged = FlaggedContent.objects.create(
+            user="testfirebaseuid",
+            post_id="p1",
+            reason="Spam",
+            content="Flagged text",
+        )
+        self.gateway = use_in_memory_firestore(self)
+
+    async def post(self, name, data, **headers):
+        return await self.async_client.post(
+            reverse(name),
+            data,
+            content_type="application/json",
+            headers={**self.headers, **headers},
+        )
+
+    async def test_check_flags_trigger_words(self):
+        """The async check returns the same result as the sync one"""
+        for name in (
+            "async-flaggedcontent-check-content",
+            "async-triggerword-check-content",
+        ):
+            response = await self.post(name, {"content": "I want to kms"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.json()["flagged"])
+            self.assertEqual(response.json()["matches"][0]["word"], "kms")
+
+    async def test_requires_authentication(self):
+        """Requests without credentials are rejected like DRF does"""
+        response = await self.async_client.post(
+            reverse("async-flaggedcontent-check-content"),
+            {"content": "hello"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_create_counts_repeat_reports(self):
+        """Create records reports and answers repeated keys from the DB"""
+        data = {
+            "content": "This post contains kms",
+            "user": "testfirebaseuid",
+            "post_id": "p2",
+            "reason": "Trigger words detected",
+        }
+        first = await self.post(
+            "async-flaggedcontent-list", data, **{"Idempotency-Key": "k1"}
+        )
+        repeat = await self.post(
+            "async-flaggedcontent-list", data, **{"Idempotency-Key": "k1"}
+        )
+        second = await self.post("async-flaggedcontent-list", data)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(repeat.status_code, status.HTTP_200_OK)
+        self.assertEqual(repeat.json()["id"], first.json()["id"])
+        self.assertEqual(second.json()["report_count"], 2)
+
+    async def test_update_sends_firestore_write(self):
+        """Updates are written to Firestore without waiting for the worker"""
+        response = await self.async_client.patch(
+            reverse("async-flaggedcontent-detail", args=[self.flagged.id]),
+            {"reviewed": True},
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()["reviewed"])
+
+        self.assertEqual(
+            self.gateway.documents["Posts/p1"],
+            {"is_visible": False, "reviewed": True},
+        )
+        self.assertFalse(await FirestoreOutbox.objects.aexists())
+
+    async def test_failed_update_is_left_for_the_worker(self):
+        """A failed Firestore write stays queued in the outbox"""
+        self.gateway.error_rate = 1
+        response = await self.async_client.patch(
+            reverse("async-flaggedcontent-detail", args=[self.flagged.id]),
+            {"is_visible": True},
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(await FirestoreOutbox.objects.acount(), 1)
+
+    async def test_update_missing_row(self):
+        """Updating a missing row returns 404"""
+        response = await self.async_client.put(
+            reverse("async-flaggedcontent-detail", args=[0]),
+            {"reviewed": True},
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_send_now_defers_to_pending_updates(self):
+        """A row is kept when another update for its document is pending"""
+        older = enqueue_update("Posts/p1", {"reviewed": True})
+        newer = enqueue_update("Posts/p1", {"reviewed": False})
+
+        self.assertTrue(async_to_sync(send_now)(newer, self.gateway))
+        self.assertEqual(FirestoreOutbox.objects.count(), 2)
+
+        older.delete()
+        self.assertTrue(async_to_sync(send_now)(newer, self.gateway))
+        self.assertFalse(FirestoreOutbox.objects.exists())
+
+
+class LazyFirebaseTest(SimpleTestCase):
+    def test_boot_does_not_import_firebase(self):
+        """Settings, views and admin load without the Firebase SDK"""
+        code = (
+            "import sys, django; django.setup();"
+            "import myapi.wsgi, moderation.views, moderation.admin;"
+            "print('firebase_admin' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "myapi.settings"},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output.strip(), "False")
+
+    def test_app_is_initialized_once(self):
+        """Concurrent first calls share a single Firebase app"""
+        apps = []
+        threads = [
+            threading.Thread(target=lambda: apps.append(firebase.get_app()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(apps), 8)
+        self.assertTrue(all(app is apps[0] for app in apps))
+
+    def test_bad_credentials_are_improperly_configured(self):
+        """A missing or unreadable FIREBASE_ADMIN_SDK is reported as such"""
+        for value in (None, "{not json", "/missing/service-account.json"):
+            with self.subTest(value=value), self.settings(
+                FIREBASE_ADMIN_SDK=value
+            ), self.assertRaises(ImproperlyConfigured):
+                firebase.credentials_info()
+
+    def test_bad_credentials_are_not_an_invalid_token(self):
+        """Authentication lets a configuration error surface as a 500"""
+        with patch(
+            "moderation.authentication.verify_id_token",
+            side_effect=ImproperlyConfigured("FIREBASE_ADMIN_SDK is not set."),
+        ), self.assertRaises(ImproperlyConfigured):
+            FirebaseAuthentication().authenticate(
+                RequestFactory().get(
+                    "/", HTTP_AUTHORIZATION="Bearer unconfigured.token"
+                )
+            )
+
+
+@override_settings(
+    MODERATION_SERVER_TIMING=True, MODERATION_METRICS_TOKEN="secret"
+)
+class MetricsTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+        TriggerWord.objects.create(word="kms", category="self-harm")
+
+    def server_timing(self, response):
+        # {phase: calls} from the Server-Timing header
+        phases = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, *params = entry.split(";")
+            phases[name] = params
+        return phases
+
+    def test_server_timing_covers_request_phases(self):
+        """Responses report auth, verification, DB and matching time"""
+        response = self.client.post(
+            reverse("flaggedcontent-check-content"),
+            {"content": "I want to kms"},
+            format="json",
+        )
+        phases = self.server_timing(response)
+        for phase in ("auth", "verify", "db", "match", "total"):
+            self.assertIn(phase, phases)
+        self.assertTrue(phases["total"][0].startswith("dur="))
+
+    def test_cached_tokens_skip_verification_phase(self):
+        """A token cache hit shows up as auth time without verify time"""
+        url = reverse("flaggedcontent-check-content")
+        self.client.post(url, {"content": "hi"}, format="json")
+        response = self.client.post(url, {"content": "hi"}, format="json")
+        phases = self.server_timing(response)
+        self.assertIn("auth", phases)
+        self.assertNotIn("verify", phases)
+
+    def test_list_reports_serialization_and_queries(self):
+        """List requests time serialization and count their queries"""
+        FlaggedContent.objects.create(
+            user="u1", post_id="p1", reason="Spam", content="text"
+        )
+        response = self.client.get(reverse("flaggedcontent-list"))
+        phases = self.server_timing(response)
+        self.assertIn("serialize", phases)
+        self.assertRegex(phases["db"][1], r'desc="\d+ calls"')
+
+    def test_metrics_endpoint_exposes_route_histograms(self):
+        """/metrics serves per-route histograms in Prometheus format"""
+        self.client.post(
+            reverse("flaggedcontent-check-content"),
+            {"content": "hello"},
+            format="json",
+        )
+        self.client.credentials()
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+        body = response.content.decode()
+        self.assertIn(
+            "# TYPE moderation_request_duration_seconds histogram", body
+        )
+        self.assertIn('route="flaggedcontent-check-content"', body)
+        self.assertIn(
+            'moderation_request_phase_seconds_count{route="flaggedcontent'
+            '-check-content",phase="match"}',
+            body,
+        )
+        self.assertIn("moderation_token_cache_misses_total", body)
+
+    def test_metrics_token(self):
+        """A configured token is required to read /metrics"""
+        self.client.credentials()
+        self.assertEqual(
+            self.client.get(reverse("metrics")).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(MODERATION_METRICS_TOKEN=None)
+    def test_metrics_without_a_token_need_debug(self):
+        """Without a token, /metrics is only served with DEBUG"""
+        self.client.credentials()
+        self.assertEqual(
+            self.client.get(reverse("metrics")).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        with self.settings(DEBUG=True):
+            response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_server_timing_is_off_by_default(self):
+        """Outside DEBUG, Server-Timing needs MODERATION_SERVER_TIMING"""
+        code = (
+            "import django; django.setup();"
+            "from django.conf import settings;"
+            "print(settings.MODERATION_SERVER_TIMING)"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "myapi.settings"}
+        env.pop("MODERATION_SERVER_TIMING", None)
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output.strip(), "False")
+
+    @override_settings(MODERATION_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        """Timings are still collected without the response header"""
+        before = sum(series[2] for series in REQUEST_DURATION._series.values())
+        response = self.client.get(reverse("flaggedcontent-list"))
+        self.assertNotIn("Server-Timing", response)
+        after = sum(series[2] for series in REQUEST_DURATION._series.values())
+        self.assertEqual(after, before + 1)
+
+    async def test_async_views_count_queries_in_threads(self):
+        """Queries run through sync_to_async are attributed to the request"""
+        response = await self.async_client.post(
+            reverse("async-flaggedcontent-list"),
+            {
+                "content": "kms",
+                "user": "testfirebaseuid",
+                "post_id": "p1",
+                "reason": "Trigger words detected",
+            },
+            content_type="application/json",
+            headers={"Authorization": "Bearer mocked.token"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("db", self.server_timing(response))
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Each bucket counts every observation at or below its bound"""
+        histogram = Histogram("test_seconds", "Test.", ("route",), (1, 2))
+        for value in (0.5, 1.5, 3):
+            histogram.observe(("r",), value)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="r",le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="r",le="2"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="r",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{route="r"} 5.0', lines)
+
+
+class TriggerWordLexiconTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        TriggerWord.objects.create(
+            word="idiot", category="insult", whole_word=False
+        )
+
+    def version(self):
+        return versions.get_version(versions.TRIGGER_WORDS)
+
+    def upsert(self, words, **kwargs):
+        return self.client.post(
+            reverse("triggerword-bulk-upsert"),
+            {"words": words, **kwargs},
+            format="json",
+        )
+
+    def test_upsert_writes_only_changes_with_one_version_bump(self):
+        """Bulk upsert diffs against the table and bumps the version once"""
+        before = self.version()
+        words = [{"word": f"word{i}", "category": "test"} for i in range(1200)]
+        words += [
+            {"word": "kms", "category": "self-harm"},
+            {"word": "idiot", "category": "insult", "whole_word": True},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upsert(words)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {"created": 1200, "updated": 1, "deleted": 0, "unchanged": 1},
+        )
+        self.assertEqual(self.version(), before + 1)
+        inserts = [
+            q
+            for q in queries.captured_queries
+            if q["sql"].startswith("INSERT")
+        ]
+        # Batched inserts rather than one per word
+        self.assertLess(len(inserts), 20)
+        self.assertTrue(TriggerWord.objects.get(word="idiot").whole_word)
+        self.assertEqual(
+            get_matcher().scan("word1199")["matches"][0]["word"], "word1199"
+        )
+
+    def test_unchanged_upsert_does_not_bump_version(self):
+        """Re-sending the current words changes nothing"""
+        before = self.version()
+        response = self.upsert([{"word": "kms", "category": "self-harm"}])
+        self.assertEqual(response.data["unchanged"], 1)
+        self.assertEqual(self.version(), before)
+
+    def test_csv_replace_deletes_missing_words(self):
+        """A CSV body with replace=true makes the table match the file"""
+        before = self.version()
+        response = self.client.post(
+            reverse("triggerword-bulk-upsert") + "?replace=true",
+            "word,category,whole_word\nkms,self-harm,true\nnew,test,\n",
+            content_type="text/csv",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {"created": 1, "updated": 0, "deleted": 1, "unchanged": 1},
+        )
+        self.assertEqual(
+            set(TriggerWord.objects.values_list("word", flat=True)),
+            {"kms", "new"},
+        )
+        self.assertEqual(self.version(), before + 1)
+
+    def test_invalid_entries_reject_the_whole_request(self):
+        """Nothing is written when any entry is invalid"""
+        response = self.upsert(
+            [
+                {"word": "fine", "category": "test"},
+                {"word": "", "category": "test"},
+                {"word": "bad", "category": "test", "whole_word": "maybe"},
+            ],
+            replace=True,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [1, 2]
+        )
+        self.assertEqual(TriggerWord.objects.count(), 2)
+
+    def test_bulk_delete_bumps_version_once(self):
+        """Deleting many words bumps the version once"""
+        before = self.version()
+        response = self.client.post(
+            reverse("triggerword-bulk-delete"),
+            {"words": ["kms", "idiot", "missing"]},
+            format="json",
+        )
+        self.assertEqual(response.data, {"deleted": 2})
+        self.assertFalse(TriggerWord.objects.exists())
+        self.assertEqual(self.version(), before + 1)
+
+    def test_bulk_delete_accepts_a_bare_list(self):
+        """A list body works like bulk, and other bodies are a 400"""
+        url = reverse("triggerword-bulk-delete")
+        response = self.client.post(url, ["kms"], format="json")
+        self.assertEqual(response.data, {"deleted": 1})
+
+        for body in ("idiot", 42):
+            with self.subTest(body=body):
+                response = self.client.post(url, body, format="json")
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+        self.assertTrue(TriggerWord.objects.filter(word="idiot").exists())
+
+    def test_export_round_trips(self):
+        """Exported words import back unchanged"""
+        for export_format in ("json", "csv"):
+            response = self.client.get(
+                reverse("triggerword-export"),
+                {"export_format": export_format},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            if export_format == "csv":
+                response = self.client.post(
+                    reverse("triggerword-bulk-upsert") + "?replace=true",
+                    response.content.decode(),
+                    content_type="text/csv",
+                )
+            else:
+                response = self.upsert(
+                    json.loads(response.content), replace=True
+                )
+            self.assertEqual(response.data["unchanged"], 2)
+            self.assertEqual(response.data["deleted"], 0)
+
+    def test_import_command(self):
+        """import_triggerwords supports dry runs and replace"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "words.json")
+        with open(path, "w") as f:
+            json.dump([{"word": "kms", "category": "crisis"}], f)
+
+        out = io.StringIO()
+        call_command("import_triggerwords", path, "--dry-run", stdout=out)
+        self.assertIn("0 created, 1 updated", out.getvalue())
+        self.assertEqual(
+            TriggerWord.objects.get(word="kms").category, "self-harm"
+        )
+
+        out = io.StringIO()
+        call_command("import_triggerwords", path, "--replace", stdout=out)
+        self.assertIn("1 updated, 1 deleted", out.getvalue())
+        self.assertEqual(TriggerWord.objects.get().category, "crisis")
+
+
+class ModerationStatsTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+        use_in_memory_firestore(self)
+
+    def report(self, post_id, reason="Spam"):
+        return self.client.post(
+            reverse("flaggedcontent-list"),
+            {
+                "content": "Flagged text",
+                "user": "testfirebaseuid",
+                "post_id": post_id,
+                "reason": reason,
+            },
+            format="json",
+        )
+
+    def mock_request(self):
+        request = RequestFactory().post("/admin/")
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    def counters(self):
+        return {
+            (dimension, value): count
+            for dimension, value, count in FlaggedContentCount.objects.exclude(
+                count=0
+            ).values_list("dimension", "value", "count")
+        }
+
+    def assertCountersMatchTable(self):
+        counters = self.counters()
+        call_command("recount_flagged_stats", stdout=io.StringIO())
+        self.assertEqual(counters, self.counters())
+
+    def test_every_write_path_keeps_the_counters_exact(self):
+        """Create, bulk, update, approve and delete adjust the counters"""
+        self.report("p1")
+        self.report("p1")  # a repeat report adds no row
+        self.report("p2", reason="Trigger words detected")
+        self.client.post(
+            reverse("flaggedcontent-bulk-create"),
+            {
+                "items": [
+                    {
+                        "content": "Flagged text",
+                        "user": "testfirebaseuid",
+                        "post_id": f"b{i}",
+                        "reason": "Spam",
+                    }
+                    for i in range(3)
+                ]
+            },
+            format="json",
+        )
+        self.assertCountersMatchTable()
+        self.assertEqual(self.counters()[("reason", "Spam")], 4)
+
+        p1 = FlaggedContent.objects.get(post_id="p1")
+        self.client.patch(
+            reverse("flaggedcontent-detail", args=[p1.pk]),
+            {"reviewed": True},
+            format="json",
+        )
+        self.assertCountersMatchTable()
+
+        approve_flagged_content(
+            FlaggedContentAdmin(FlaggedContent, AdminSite()),
+            self.mock_request(),
+            FlaggedContent.objects.filter(post_id__in=["p1", "b0"]),
+        )
+        self.assertCountersMatchTable()
+        self.assertEqual(self.counters()[("is_visible", "true")], 2)
+
+        self.client.delete(reverse("flaggedcontent-detail", args=[p1.pk]))
+        FlaggedContentAdmin(FlaggedContent, AdminSite()).delete_queryset(
+            None, FlaggedContent.objects.filter(post_id="b1")
+        )
+        self.assertCountersMatchTable()
+        self.assertEqual(self.counters()[("total", "")], 3)
+
+    def test_async_update_adjusts_the_counters(self):
+        """The async update path keeps the counters exact too"""
+        self.report("p1")
+        pk = FlaggedContent.objects.get().pk
+
+        async def review():
+            return await self.async_client.patch(
+                reverse("async-flaggedcontent-detail", args=[pk]),
+                {"reviewed": True, "is_visible": True},
+                content_type="application/json",
+                headers={"Authorization": "Bearer mocked.token"},
+            )
+
+        response = async_to_sync(review)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counters()[("reviewed", "true")], 1)
+        self.assertCountersMatchTable()
+
+    def test_write_paths_lock_counters_before_the_version(self):
+        """Counters are written before the CacheVersion row every time"""
+
+        order = ["flaggedcontentcount", "cacheversion"]
+
+        def tables_written(write):
+            with CaptureQueriesContext(connection) as queries:
+                write()
+            return [
+                table
+                for query in queries
+                if query["sql"].startswith(("INSERT", "UPDATE"))
+                for table in order
+                if f'"moderation_{table}"' in query["sql"]
+            ]
+
+        self.report("p1")
+        p1 = FlaggedContent.objects.get(post_id="p1")
+        update_counted(FlaggedContent.objects.all(), reviewed=True)
+        writes = {
+            "create": lambda: self.report("p2"),
+            "repeat report": lambda: self.report("p1"),
+            "bulk": lambda: self.client.post(
+                reverse("flaggedcontent-bulk-create"),
+                {
+                    "items": [
+                        {
+                            "content": "Flagged text",
+                            "user": "testfirebaseuid",
+                            "post_id": post_id,
+                            "reason": "Spam",
+                        }
+                        for post_id in ("p1", "p3")
+                    ]
+                },
+                format="json",
+            ),
+            "review": lambda: self.client.patch(
+                reverse("flaggedcontent-detail", args=[p1.pk]),
+                {"reviewed": True},
+                format="json",
+            ),
+        }
+        for name, write in writes.items():
+            with self.subTest(name):
+                tables = tables_written(write)
+                self.assertEqual(set(tables), set(order))
+                self.assertEqual(tables, sorted(tables, key=order.index))
+
+    def test_stats_reads_counters_not_the_table(self):
+        """The stats action summarizes the queue without counting rows"""
+        self.report("p1")
+        self.report("p2", reason="Trigger words detected")
+        FlaggedContent.objects.filter(post_id="p1").update(
+            flagged_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+
+        url = reverse("flaggedcontent-stats")
+        self.client.get(url)  # caches the verified token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            any("COUNT(" in q["sql"].upper() for q in queries.captured_queries)
+        )
+        today = timezone.localdate().isoformat()
+        self.assertEqual(response.data["total"], 2)
+        self.assertEqual(response.data["reviewed"], {"true": 0, "false": 2})
+        self.assertEqual(
+            response.data["reasons"],
+            {"Spam": 1, "Trigger words detected": 1},
+        )
+        self.assertEqual(response.data["days"], {today: 2})
+        self.assertGreaterEqual(
+            response.data["oldest_unreviewed_age"], 2 * 60 * 60
+        )
+
+        response = self.client.get(url, {"days": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DatabaseSettingsTest(TestCase):
+    def settings_probe(self, **env):
+        code = (
+            "import json; from django.conf import settings;"
+            "print(json.dumps(settings.DATABASES['default'], default=str))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            env={
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": "myapi.settings",
+                **env,
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        return json.loads(output)
+
+    def test_database_url_uses_persistent_checked_connections(self):
+        """DATABASE_URL selects the database with pooled connections"""
+        database = self.settings_probe(
+            DATABASE_URL="postgres://moderation:secret@db:5432/moderation"
+        )
+        self.assertEqual(
+            database["ENGINE"], "django.db.backends.postgresql_psycopg2"
+        )
+        self.assertEqual(database["NAME"], "moderation")
+        self.assertEqual(database["CONN_MAX_AGE"], 600)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+
+    def test_sqlite_pragmas_are_applied(self):
+        """Every SQLite connection gets the configured PRAGMAs"""
+
+        def busy_timeout():
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA busy_timeout")
+                return cursor.fetchone()[0]
+
+        original = busy_timeout()
+        with self.settings(SQLITE_PRAGMAS={"busy_timeout": 1234}):
+            configure_sqlite(connection)
+        self.assertEqual(busy_timeout(), 1234)
+
+        with self.settings(SQLITE_PRAGMAS={"busy_timeout": original}):
+            configure_sqlite(connection)
+
+    def test_journal_mode_is_only_switched_once(self):
+        """A database already in WAL mode is not switched again"""
+        sqlite = MagicMock(vendor="sqlite")
+        cursor = sqlite.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ("wal",)
+        pragmas = {"journal_mode": "wal", "synchronous": "normal"}
+        with self.settings(SQLITE_PRAGMAS=pragmas):
+            configure_sqlite(sqlite)
+        self.assertEqual(
+            [call.args[0] for call in cursor.execute.call_args_list],
+            ["PRAGMA journal_mode", "PRAGMA synchronous = normal"],
+        )
+
+        cursor.reset_mock()
+        cursor.fetchone.return_value = ("delete",)
+        with self.settings(SQLITE_PRAGMAS=pragmas):
+            configure_sqlite(sqlite)
+        self.assertIn(
+            "PRAGMA journal_mode = wal",
+            [call.args[0] for call in cursor.execute.call_args_list],
+        )
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+        cache.clear()
+        use_in_memory_firestore(self)
+
+        for post_id in ("p1", "p2"):
+            self.client.post(
+                reverse("flaggedcontent-list"),
+                {
+                    "content": "Flagged text",
+                    "user": "testfirebaseuid",
+                    "post_id": post_id,
+                    "reason": "Spam",
+                },
+                format="json",
+            )
+
+    def table_queries(self, queries):
+        return [
+            q["sql"]
+            for q in queries.captured_queries
+            if "moderation_flaggedcontent" in q["sql"]
+        ]
+
+    def test_current_etag_returns_304_without_queries(self):
+        """A matching If-None-Match skips the queryset and serializer"""
+        url = reverse("flaggedcontent-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.table_queries(queries), [])
+
+        # Filters and pages have their own ETags
+        response = self.client.get(
+            url, {"reviewed": "true"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_change_the_etag(self):
+        """Every write path moves list and detail ETags on"""
+        flagged = FlaggedContent.objects.get(post_id="p1")
+        list_url = reverse("flaggedcontent-list")
+        detail_url = reverse("flaggedcontent-detail", args=[flagged.pk])
+        etags = {
+            url: self.client.get(url)["ETag"] for url in (list_url, detail_url)
+        }
+
+        self.client.patch(detail_url, {"reviewed": True}, format="json")
+
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response["ETag"], etag)
+        self.assertTrue(response.data["reviewed"])
+
+    def test_if_modified_since_does_not_hide_writes(self):
+        """A write in the same second as a GET is never answered with 304"""
+        url = reverse("flaggedcontent-list")
+        last_modified = self.client.get(url)["Last-Modified"]
+        flagged = FlaggedContent.objects.get(post_id="p1")
+        self.client.patch(
+            reverse("flaggedcontent-detail", args=[flagged.pk]),
+            {"reviewed": True},
+            format="json",
+        )
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["results"][0]["reviewed"])
+
+    def test_rendered_pages_are_served_from_the_cache(self):
+        """Repeat requests reuse the rendered page until a write"""
+        url = reverse("flaggedcontent-list")
+        first = self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(self.table_queries(queries), [])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Content-Type"], first["Content-Type"])
+
+        self.client.post(
+            reverse("flaggedcontent-list"),
+            {
+                "content": "Flagged text",
+                "user": "testfirebaseuid",
+                "post_id": "p3",
+                "reason": "Spam",
+            },
+            format="json",
+        )
+        self.assertEqual(len(self.client.get(url).data["results"]), 3)
+
+    def test_trigger_words_use_their_own_version(self):
+        """Trigger word pages are validated against the word list version"""
+        TriggerWord.objects.create(word="kms", category="self-harm")
+        url = reverse("triggerword-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+
+        TriggerWord.objects.create(word="hopeless", category="self-harm")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+class FastPathSerializationTest(APITestCase):
+    def setUp(self):
+        use_mock_firebase(self)
+        cache.clear()
+
+        # Text JSON encoders tend to disagree on, and both a whole-second
+        # and a sub-second timestamp
+        contents = [
+            'Quotes " and \\ backslashes',
+            "Ünïcödé, emoji \U0001f600 and \u2028\u2029 separators",
+            "Control \x00\x1f\x7f\n\t characters </script>",
+        ]
+        for i, content in enumerate(contents):
+            FlaggedContent.objects.create(
+                user="testfirebaseuid",
+                post_id=f"p{i}",
+                comment_id="c1" if i else None,
+                content=content,
+                reason="Spam",
+                reviewed=i == 1,
+                report_count=i + 1,
+            )
+        FlaggedContent.objects.filter(post_id="p0").update(
+            flagged_at=datetime.datetime(2024, 5, 1, tzinfo=datetime.UTC)
+        )
+
+    def expected(self):
+        return FlaggedContentSerializer(
+            FlaggedContent.objects.order_by("flagged_at", "id"), many=True
+        ).data
+
+    def test_rows_match_the_serializer(self):
+        """Fast rows are the serializer's output, key order included"""
+        queryset = FlaggedContent.objects.order_by("flagged_at", "id")
+        for zone in ("UTC", "Europe/Paris"):
+            with timezone.override(zone):
+                rows = list(
+                    flagged_content_rows(flagged_content_values(queryset))
+                )
+                expected = self.expected()
+            self.assertEqual(rows, expected)
+            self.assertEqual(
+                [list(row) for row in rows], [list(row) for row in expected]
+            )
+
+    def test_list_is_byte_identical(self):
+        """The list page renders exactly as the serializer path did"""
+        response = self.client.get(reverse("flaggedcontent-list"))
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(
+                {"next": None, "previous": None, "results": self.expected()}
+            ),
+        )
+
+        # Cursors are still taken from the rows' flagged_at
+        url = reverse("flaggedcontent-list") + "?page_size=1"
+        post_ids = []
+        while url:
+            data = self.client.get(url).data
+            post_ids += [row["post_id"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(post_ids, ["p0", "p1", "p2"])
+
+    def test_export_is_byte_identical(self):
+        """NDJSON export lines match the serializer's output"""
+        response = self.client.get(reverse("flaggedcontent-export"))
+        self.assertEqual(
+            b"".join(response.streaming_content).decode(),
+            "".join(
+                json.dumps(row, ensure_ascii=False) + "\n"
+                for row in self.expected()
+            ),
+        )
+
+    def test_fast_renderer_matches_json_renderer(self):
+        """FastJSONRenderer output is JSONRenderer's, with or without orjson"""
+        data = {
+            "results": list(self.expected()),
+            "nested": {"flags": [True, False, None], "count": 2**40},
+            "flagged_at": timezone.now(),
+        }
+        values = (data, self.expected(), {"detail": "\u2028"}, None)
+        fast = FastJSONRenderer()
+        for orjson in (renderers.orjson, None):
+            with patch("moderation.renderers.orjson", orjson):
+                for value in values:
+                    self.assertEqual(
+                        fast.render(value), JSONRenderer().render(value)
+                    )
+                self.assertEqual(
+                    fast.render(data, renderer_context={"indent": 4}),
+                    JSONRenderer().render(
+                        data, renderer_context={"indent": 4}
+                    ),
+                )
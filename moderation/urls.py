@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import FlaggedContentViewSet, TriggerWordViewSet
+from moderation import async_views
 from moderation import views as moderation_views
 
 router = DefaultRouter()
@@ -15,6 +16,31 @@ router.register(
     basename="triggerword",
 )
 
+# Async versions of the hot endpoints, for ASGI deployments
+async_urlpatterns = [
+    path(
+        "flagged-content/",
+        async_views.create_flagged_content,
+        name="async-flaggedcontent-list",
+    ),
+    path(
+        "flagged-content/<int:pk>/",
+        async_views.update_flagged_content,
+        name="async-flaggedcontent-detail",
+    ),
+    path(
+        "flagged-content/check/",
+        async_views.check_content,
+        name="async-flaggedcontent-check-content",
+    ),
+    path(
+        "triggerwords/check/",
+        async_views.check_content,
+        name="async-triggerword-check-content",
+    ),
+]
+
 urlpatterns = [
+    path("async/", include(async_urlpatterns)),
     path("", include(router.urls)),
 ]
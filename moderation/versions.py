@@ -0,0 +1,42 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CacheVersion
+
+TRIGGER_WORDS = "triggerwords"
+FLAGGED_CONTENT = "flaggedcontent"
+
+
+def get_version(name):
+    version = (
+        CacheVersion.objects.filter(name=name)
+        .values_list("version", flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def get_version_info(name):
+    # (version, updated_at), or (0, None) before the first bump
+    info = (
+        CacheVersion.objects.filter(name=name)
+        .values_list("version", "updated_at")
+        .first()
+    )
+    return info or (0, None)
+
+
+def bump_version(name):
+    updated = CacheVersion.objects.filter(name=name).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            CacheVersion.objects.create(name=name, version=1)
+    except IntegrityError:
+        # Another worker created the row first
+        bump_version(name)
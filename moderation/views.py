@@ -1,127 +1,330 @@
-from rest_framework import viewsets, status
+import csv
+from functools import partial
+
+from rest_framework import serializers, viewsets, status
 from rest_framework.response import Response
 from .models import FlaggedContent, TriggerWord
-from .serializers import FlaggedContentSerializer, TriggerWordSerializer
+from .serializers import (
+    FlaggedContentSerializer,
+    TriggerWordSerializer,
+    flagged_content_rows,
+    flagged_content_values,
+)
+from . import versions
+from .caching import conditional_response
+from .matcher import get_matcher
+from .filters import filter_flagged_content
+from .pagination import FlaggedContentCursorPagination
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .export import EXPORT_FORMATS, export_flagged_content
+from .flagging import (
+    build_flagged_content,
+    record_report,
+    record_reports,
+    save_review,
+)
+from .stats import delete_counted, queue_stats
+from .metrics import timed
+from .lexicon import (
+    LEXICON_FORMATS,
+    apply_diff,
+    clean_entries,
+    delete_words,
+    diff_lexicon,
+    export_lexicon,
+    parse_lexicon,
+)
+from .parsers import CSVTextParser
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
-import firebase_admin
-from firebase_admin import firestore
-
-# Initialize Firestore (make sure to configure Firebase Admin SDK)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
+from rest_framework.renderers import BrowsableAPIRenderer
 
 
 class FlaggedContentViewSet(viewsets.ModelViewSet):
     queryset = FlaggedContent.objects.all()
     serializer_class = FlaggedContentSerializer
+    pagination_class = FlaggedContentCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = filter_flagged_content(
+                queryset, self.request.query_params
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, versions.FLAGGED_CONTENT, partial(self.list_page, request)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            versions.FLAGGED_CONTENT,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def list_page(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Read-only, so rows skip the model and the serializer fields
+        page = self.paginate_queryset(flagged_content_values(queryset))
+        with timed("serialize"):
+            data = list(flagged_content_rows(page))
+        return self.get_paginated_response(data)
 
     def create(self, request, *args, **kwargs):
-        try:
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key and len(idempotency_key) > 255:
+            return Response(
+                {"error": "Idempotency-Key may be at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            # Get parent type and set required fields
-            parent_type = request.data.get("parent_type", "post")
-            required_fields = ["content", "reason", "user"]
-
-            # Ensure required fields based on parent_type
-            if parent_type == "post":
-                required_fields.append("post_id")
-            elif parent_type == "comment":
-                required_fields.extend(["post_id", "comment_id"])
-            elif parent_type == "reply":
-                required_fields.extend(["post_id", "comment_id", "reply_id"])
-            else:
-                raise ValueError("Invalid parent_type specified.")
-
-            # Check for missing fields
-            for field in required_fields:
-                if field not in request.data:
-                    raise ValueError(
-                        f"'{field}' is a required field for {parent_type}."
-                    )
-
-            # Create flagged content instance
-            flagged_content = FlaggedContent.objects.create(
-                post_id=request.data.get("post_id"),
-                content=request.data["content"],
-                reason=request.data["reason"],
-                user=request.data["user"],
-                comment_id=request.data.get("comment_id"),
-                reply_id=request.data.get("reply_id"),
-            )
-            return Response({"success": True}, status=status.HTTP_201_CREATED)
+        try:
+            # Create flagged content instance, or count a repeat report
+            flagged_content, created = record_report(
+                build_flagged_content(request.data), idempotency_key
+            )
+            return Response(
+                {
+                    "success": True,
+                    "id": flagged_content.id,
+                    "report_count": flagged_content.report_count,
+                    "duplicate": not created,
+                },
+                status=(
+                    status.HTTP_201_CREATED if created else status.HTTP_200_OK
+                ),
+            )
 
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    # Action to record many flagged content reports in one insert
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be a JSON object."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        items = request.data.get("items")
+        if not isinstance(items, list):
+            return Response(
+                {"error": "'items' must be a list."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        max_items = settings.MODERATION_BULK_CREATE_MAX_ITEMS
+        if len(items) > max_items:
+            return Response(
+                {"error": f"At most {max_items} items per bulk request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Validate every item first so one bad row cannot abort the insert
+        instances = []
+        errors = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Each item must be an object.")
+                instance = build_flagged_content(item)
+                instance.clean_fields()
+            except ValidationError as e:
+                errors.append({"index": index, "error": e.message_dict})
+                continue
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+                continue
+            instances.append(instance)
+
+        created, duplicates = record_reports(instances)
+
+        return Response(
+            {"created": created, "duplicates": duplicates, "errors": errors},
+            status=(
+                status.HTTP_201_CREATED
+                if instances or not errors
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+    # Action to stream every matching record as NDJSON or CSV
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        renderer_classes=[
+            FastJSONRenderer,
+            BrowsableAPIRenderer,
+            NDJSONRenderer,
+            CSVRenderer,
+        ],
+    )
+    def export(self, request):
+        # ?export_format wins; otherwise an Accept header naming one of the
+        # formats picks it
+        default = request.accepted_renderer.format
+        if default not in EXPORT_FORMATS:
+            default = "ndjson"
+        export_format = request.query_params.get("export_format", default)
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": "export_format must be 'ndjson' or 'csv'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = filter_flagged_content(
+            FlaggedContent.objects.order_by("flagged_at", "id"),
+            request.query_params,
+        )
+        response = StreamingHttpResponse(
+            export_flagged_content(
+                queryset,
+                export_format,
+                asynchronous=isinstance(request._request, ASGIRequest),
+            ),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="flagged-content.{export_format}"'
+        )
+        return response
+
+    def perform_destroy(self, instance):
+        delete_counted(FlaggedContent.objects.filter(pk=instance.pk))
+
+    # Action to summarize the moderation queue from the stats counters,
+    # without counting the table
+    @action(detail=False, methods=["get"], url_path="stats")
+    def stats(self, request):
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 366:
+            return Response(
+                {"error": "days must be between 1 and 366."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        summary = queue_stats(days)
+        oldest = summary["oldest_unreviewed_at"]
+        if oldest is not None:
+            field = serializers.DateTimeField()
+            summary["oldest_unreviewed_at"] = field.to_representation(oldest)
+        return Response(summary, status=status.HTTP_200_OK)
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
+        # Only the fields sent are changed, so a reopen that commits before
+        # the save is not undone by this request's copy of the row
         data = {
-            "reviewed": request.data.get("reviewed", instance.reviewed),
-            "is_visible": request.data.get("is_visible", instance.is_visible),
+            field: request.data[field]
+            for field in ("reviewed", "is_visible")
+            if field in request.data
         }
         serializer = self.get_serializer(instance, data=data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
 
-        # Firestore update logic
-        try:
-            db = firestore.client()
-
-            # Determine Firestore path based on available IDs in the instance
-            if instance.reply_id:
-                # If it's a reply
-                doc_ref = (
-                    db.collection("Posts")
-                    .document(instance.post_id)
-                    .collection("Comments")
-                    .document(instance.comment_id)
-                    .collection("Replies")
-                    .document(instance.reply_id)
-                )
-            elif instance.comment_id:
-                # If it's a comment
-                doc_ref = (
-                    db.collection("Posts")
-                    .document(instance.post_id)
-                    .collection("Comments")
-                    .document(instance.comment_id)
-                )
-            else:
-                # If it's a post
-                doc_ref = db.collection("Posts").document(instance.post_id)
+        # The change, its stats counters and its Firestore update commit
+        # together; the sync_firestore worker sends the update
+        save_review(serializer)
 
-            # Update Firestore document visibility and review status
-            doc_ref.update(
-                {
-                    "is_visible": data["is_visible"],
-                    "reviewed": data["reviewed"],
-                }
+        with timed("serialize"):
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
+
+    # Action to check for trigger words
+    @action(detail=False, methods=["post"], url_path="check")
+    def check_content(self, request):
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be a JSON object."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        except Exception as e:
+        content = request.data.get("content", "")
+        if not isinstance(content, str):
             return Response(
-                {"error": f"Firestore update failed: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {"error": "'content' must be a string."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with timed("match"):
+            result = get_matcher().scan(content)
 
-    # Action to check for trigger words
-    @action(detail=False, methods=["post"], url_path="check")
-    def check_content(self, request):
-        content = request.data.get("content", "")
-        trigger_words = TriggerWord.objects.values_list("word", flat=True)
-        flagged = any(word in content.lower() for word in trigger_words)
+        if result["flagged"]:
+            result["message"] = "Content contains trigger words."
+
+        return Response(result, status=status.HTTP_200_OK)
+
+    # Action to check many texts against the trigger words at once
+    @action(detail=False, methods=["post"], url_path="check-batch")
+    def check_batch(self, request):
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be a JSON object."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        items = request.data.get("items")
+        if not isinstance(items, list):
+            return Response(
+                {"error": "'items' must be a list."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        max_items = settings.MODERATION_CHECK_BATCH_MAX_ITEMS
+        if len(items) > max_items:
+            return Response(
+                {"error": f"A batch may contain at most {max_items} items."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(items)
+        texts = []
+        positions = []
+        for index, item in enumerate(items):
+            item_id = item.get("id") if isinstance(item, dict) else None
+            content = item.get("content") if isinstance(item, dict) else None
+            if not isinstance(content, str):
+                results[index] = {
+                    "id": item_id,
+                    "error": "'content' must be a string.",
+                }
+                continue
+            results[index] = {"id": item_id}
+            texts.append(content)
+            positions.append(index)
 
-        if flagged:
+        max_bytes = settings.MODERATION_CHECK_BATCH_MAX_BYTES
+        if sum(len(text.encode()) for text in texts) > max_bytes:
             return Response(
-                {"flagged": True, "message": "Content contains trigger words."}
+                {"error": f"Batch content exceeds {max_bytes} bytes."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             )
 
-        return Response({"flagged": False}, status=status.HTTP_200_OK)
+        # Load the trigger words once for the whole batch
+        with timed("match"):
+            matcher = get_matcher()
+            scans = [matcher.scan(text) for text in texts]
+        for index, result in zip(positions, scans):
+            results[index].update(result)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class TriggerWordViewSet(viewsets.ModelViewSet):
@@ -131,15 +334,132 @@ class TriggerWordViewSet(viewsets.ModelViewSet):
         IsAuthenticated
     ]  # Ensures only authenticated users can access
 
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            versions.TRIGGER_WORDS,
+            partial(super().list, request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            versions.TRIGGER_WORDS,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
     @action(detail=False, methods=["post"], url_path="check")
     def check_content(self, request):
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be a JSON object."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         content = request.data.get("content", "")
-        trigger_words = TriggerWord.objects.values_list("word", flat=True)
-        flagged = any(word in content.lower() for word in trigger_words)
+        if not isinstance(content, str):
+            return Response(
+                {"error": "'content' must be a string."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with timed("match"):
+            result = get_matcher().scan(content)
+
+        if result["flagged"]:
+            result["message"] = "Content contains trigger words."
+
+        return Response(result, status=status.HTTP_200_OK)
+
+    # Action to create or update many trigger words from JSON or CSV.
+    # Only rows that differ from the table are written, in one transaction
+    # with a single matcher rebuild.
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        parser_classes=[JSONParser, CSVTextParser],
+    )
+    def bulk_upsert(self, request):
+        replace = request.query_params.get("replace") == "true"
+        data = request.data
+        if isinstance(data, str):
+            try:
+                items = parse_lexicon(data, "csv")
+            except csv.Error as e:
+                return Response(
+                    {"error": f"Invalid CSV: {e}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        elif isinstance(data, dict):
+            items = data.get("words")
+            replace = replace or data.get("replace") is True
+        else:
+            items = data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "'words' must be a list."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        max_items = settings.MODERATION_LEXICON_MAX_ITEMS
+        if len(items) > max_items:
+            return Response(
+                {"error": f"At most {max_items} trigger words per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Nothing is written unless every entry is valid, since a partial
+        # replace would delete words the client meant to keep
+        entries, errors = clean_entries(items)
+        if errors:
+            return Response(
+                {"errors": errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            with transaction.atomic():
+                result = apply_diff(diff_lexicon(entries, replace))
+        except IntegrityError:
+            return Response(
+                {"error": "Trigger words changed concurrently, try again."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+    # Action to delete many trigger words by word
+    @action(detail=False, methods=["post"], url_path="bulk-delete")
+    def bulk_delete(self, request):
+        # A bare list is accepted as well, like bulk_upsert does
+        data = request.data
+        words = data.get("words") if isinstance(data, dict) else data
+        if not isinstance(words, list) or not all(
+            isinstance(word, str) for word in words
+        ):
+            return Response(
+                {"error": "'words' must be a list of strings."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {"deleted": delete_words(words)}, status=status.HTTP_200_OK
+        )
 
-        if flagged:
+    # Action to download every trigger word in a form bulk accepts
+    @action(detail=False, methods=["get"], url_path="export")
+    def export(self, request):
+        export_format = request.query_params.get("export_format", "json")
+        if export_format not in LEXICON_FORMATS:
             return Response(
-                {"flagged": True, "message": "Content contains trigger words."}
+                {"error": "export_format must be 'json' or 'csv'."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        return Response({"flagged": False}, status=status.HTTP_200_OK)
+        response = HttpResponse(
+            export_lexicon(export_format),
+            content_type=LEXICON_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="triggerwords.{export_format}"'
+        )
+        return response
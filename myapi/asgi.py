@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myapi.settings")
 
 application = get_asgi_application()
+
+# Load the Firebase signing keys before the first request
+from moderation.keystore import warm_up  # noqa: E402
+
+warm_up()